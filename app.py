@@ -1,29 +1,129 @@
+import time
+
+# Start of the module import, for the startup report
+IMPORT_START = time.perf_counter()
+
 import os
-from flask import Flask, render_template, request, send_file, jsonify
-from datetime import datetime, timedelta
+from flask import Flask, render_template, request, send_file, jsonify, Response, url_for
+from datetime import datetime, timedelta, date
 import calendar
+import csv
+import hashlib
 import io
-from openpyxl import Workbook
-from openpyxl.styles import PatternFill, Font, Alignment, Border, Side, Color
-from openpyxl.utils import get_column_letter
-from functools import lru_cache
+import json
+import multiprocessing
+import re
+import tempfile
+import importlib
+import bisect
+import random
+import reprlib
+import sqlite3
+import threading
+import unicodedata
+import uuid
+import zipfile
+import zlib
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+from functools import lru_cache, partial
 import logging
 from werkzeug.middleware.profiler import ProfilerMiddleware
 from io import BytesIO
-from reportlab.lib.pagesizes import landscape, A4
-from reportlab.pdfgen import canvas
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Spacer
-from reportlab.lib import colors
-from reportlab.platypus import Paragraph
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+
+# orjson is optional; without it responses are encoded with the json module
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# brotli is optional; without it only gzip is offered
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+class JsonLogFormatter(logging.Formatter):
+    """
+    Format log records as one JSON object per line
+    
+    Records logged through log_event() keep their fields as separate keys so
+    log pipelines can filter on them without parsing the message.
+    """
+    
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name
+        }
+        event = getattr(record, 'event', None)
+        if event is not None:
+            entry['event'] = event
+            entry.update(record.fields)
+        else:
+            entry['message'] = record.getMessage()
+        if record.exc_info:
+            entry['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+class EventFields:
+    """
+    Render event fields as key=value pairs, only when a record is formatted
+    """
+    __slots__ = ('fields',)
+    
+    def __init__(self, fields):
+        self.fields = fields
+    
+    def __str__(self):
+        return ' '.join(f'{key}={value}' for key, value in self.fields.items())
+
+# Configure logging: LOG_LEVEL sets the level, LOG_FORMAT=json switches to
+# one JSON object per line
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+LOG_FORMAT = os.environ.get('LOG_FORMAT', 'text').lower()
+if LOG_FORMAT == 'json':
+    log_handler = logging.StreamHandler()
+    log_handler.setFormatter(JsonLogFormatter())
+    logging.basicConfig(level=LOG_LEVEL, handlers=[log_handler])
+else:
+    logging.basicConfig(
+        level=LOG_LEVEL,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
 logger = logging.getLogger(__name__)
 
+# Fraction of /generate requests whose payload is logged at DEBUG level
+PAYLOAD_LOG_SAMPLE_RATE = float(os.environ.get('PAYLOAD_LOG_SAMPLE_RATE', 0.01))
+
+# Bounded repr for payload samples, so a large roster is never formatted whole
+payload_repr = reprlib.Repr()
+payload_repr.maxlist = 3
+payload_repr.maxdict = 6
+payload_repr.maxstring = 60
+
+def log_event(event, level=logging.INFO, **fields):
+    """
+    Log one structured event, formatting nothing unless the level is enabled
+    
+    Args:
+        event: Short name of the event, e.g. 'generate'
+        level: The logging level
+        **fields: Values logged as key=value pairs, or as JSON keys in JSON mode
+    """
+    if logger.isEnabledFor(level):
+        logger.log(level, '%s %s', event, EventFields(fields), extra={'event': event, 'fields': fields})
+
+def log_payload_sample(label, data):
+    """
+    Log a bounded dump of a request payload for a sample of requests
+    """
+    if logger.isEnabledFor(logging.DEBUG) and random.random() < PAYLOAD_LOG_SAMPLE_RATE:
+        logger.debug('%s payload sample: %s', label, payload_repr.repr(data))
+
 app = Flask(__name__)
 
 # Enable profiling conditionally
@@ -31,16 +131,129 @@ if os.environ.get('ENABLE_PROFILING') == '1':
     app.config['PROFILE'] = True
     app.wsgi_app = ProfilerMiddleware(app.wsgi_app, restrictions=[30])
 
+# Number of distinct shift patterns kept in the pattern cache
+PATTERN_CACHE_SIZE = int(os.environ.get('PATTERN_CACHE_SIZE', 1024))
+
+# Longest date range accepted by /generate_range
+MAX_RANGE_MONTHS = int(os.environ.get('MAX_RANGE_MONTHS', 24))
+
+# Generated schedules kept for exports, in memory and in a spool directory
+SCHEDULE_STORE_DIR = os.environ.get(
+    'SCHEDULE_STORE_DIR', os.path.join(tempfile.gettempdir(), 'duty-scheduler', 'schedules')
+)
+SCHEDULE_STORE_SIZE = int(os.environ.get('SCHEDULE_STORE_SIZE', 64))
+SCHEDULE_STORE_MAX_FILES = int(os.environ.get('SCHEDULE_STORE_MAX_FILES', 512))
+SCHEDULE_ID_PATTERN = re.compile(r'[0-9a-f]{32}')
+
+# SQLite database holding saved rosters and the schedules generated from them.
+# It lives in the app's instance folder rather than the temp directory, which
+# the OS may clear
+DATABASE_PATH = os.environ.get('DATABASE_PATH', os.path.join(app.instance_path, 'duty_scheduler.db'))
+
+# Modules behind each export format. They are imported on first use, so
+# workers that only serve the page and /generate never load them.
+EXPORT_BACKENDS = {
+    'xlsx': ('openpyxl', 'openpyxl.styles', 'openpyxl.utils', 'openpyxl.cell'),
+    'pdf': ('reportlab.lib.pagesizes', 'reportlab.lib.colors', 'reportlab.lib.styles',
+            'reportlab.platypus')
+}
+
+# Seconds spent importing this module and each export backend
+IMPORT_TIMES = {}
+
+# A run of one repeated shift code in a row
+SHIFT_RUN_PATTERN = re.compile(r'(.)\1*')
+
+# Total size of rendered Excel/PDF files cached per worker
+ARTIFACT_CACHE_BYTES = int(os.environ.get('ARTIFACT_CACHE_BYTES', 64 * 1024 * 1024))
+
+# Part of every export ETag; bump it when the layout of the files changes so
+# clients don't keep files rendered by an older release
+EXPORT_LAYOUT_VERSION = 2
+
+# Working shifts summarised under the exported schedules
+COVERAGE_SUMMARY_SHIFTS = ('A', 'B', 'C', 'G')
+
+# JSON and CSV responses smaller than this are sent uncompressed
+COMPRESS_MIN_BYTES = int(os.environ.get('COMPRESS_MIN_BYTES', 1024))
+COMPRESS_LEVEL = int(os.environ.get('COMPRESS_LEVEL', 6))
+COMPRESSIBLE_MIMETYPES = ('application/json', 'application/x-ndjson', 'text/csv')
+
+# Employees per chunk when /generate streams its response
+STREAM_CHUNK_EMPLOYEES = int(os.environ.get('STREAM_CHUNK_EMPLOYEES', 500))
+
+# Background export jobs: spool directory, pool processes per worker, and
+# how long finished jobs are kept (seconds)
+EXPORT_JOB_DIR = os.environ.get(
+    'EXPORT_JOB_DIR', os.path.join(tempfile.gettempdir(), 'duty-scheduler', 'jobs')
+)
+EXPORT_JOB_WORKERS = int(os.environ.get('EXPORT_JOB_WORKERS', 2))
+EXPORT_JOB_TTL = int(os.environ.get('EXPORT_JOB_TTL', 3600))
+JOB_ID_PATTERN = re.compile(r'[0-9a-f]{32}')
+
+# Seconds the coverage solver may spend on one /generate request
+SOLVER_TIME_BUDGET = float(os.environ.get('SOLVER_TIME_BUDGET', 2.0))
+# Rounds before the solver may undo a move that left the shortfall unchanged
+SOLVER_TABU_TENURE = 20
+
+# /generate_batch: most groups per batch, pool processes per worker, and the
+# batch size (in employees) from which groups are generated in the pool.
+# Exports and batches share one pool per worker, sized for the larger need
+MAX_BATCH_GROUPS = int(os.environ.get('MAX_BATCH_GROUPS', 1000))
+BATCH_WORKERS = int(os.environ.get('BATCH_WORKERS', os.cpu_count() or 2))
+BATCH_PARALLEL_MIN_EMPLOYEES = int(os.environ.get('BATCH_PARALLEL_MIN_EMPLOYEES', 20000))
+
+class Employee:
+    """
+    One validated employee record
+
+    Attributes:
+        name, code, post: Identify the employee in the schedule
+        start_shift: The shift the employee starts the period on
+        rest_day: The rest day as sent by the client (0 = Sunday ... 6 = Saturday)
+        weekday: The rest day as a Python weekday (0 = Monday ... 6 = Sunday)
+        locked: Whether the coverage solver must keep this employee's pattern
+    """
+    __slots__ = ('name', 'code', 'post', 'start_shift', 'rest_day', 'weekday', 'locked')
+
+    REQUIRED_KEYS = ('name', 'code', 'post', 'start_shift', 'rest_day')
+
+    def __init__(self, name, code, post, start_shift, rest_day, locked=False):
+        self.name = name
+        self.code = code
+        self.post = post
+        self.start_shift = start_shift
+        self.rest_day = rest_day
+        # Convert Sunday from 0 to 6
+        self.weekday = 6 if rest_day == 0 else rest_day - 1
+        self.locked = locked
+    
+    @staticmethod
+    def rest_day_from_weekday(weekday):
+        """Convert a Python weekday back to the client's rest day (0 = Sunday)"""
+        return (weekday + 1) % 7
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'code': self.code,
+            'post': self.post,
+            'start_shift': self.start_shift,
+            'rest_day': self.rest_day,
+            'locked': self.locked
+        }
+
 class DutyScheduler:
     def __init__(self):
         self.shifts = {
             'A': '06:00-14:00',
             'B': '14:00-22:00',
             'C': '22:00-06:00',
-            'G': 'General',
+            'G': '09:00-17:00',
             'R': 'Rest'
         }
         self.shift_rotation = {'A': 'C', 'C': 'B', 'B': 'A'}
+        self.start_shifts = ('A', 'B', 'C', 'G')
         # Color mappings for the Excel output
         self.shift_colors = {
             'A': '3b82f6',  # Blue
@@ -49,6 +262,14 @@ class DutyScheduler:
             'G': '14b8a6',  # Teal
             'R': '64748b'   # Gray
         }
+        # Background and text colors for the PDF cells, matching the shift badges
+        self.shift_badge_colors = {
+            'A': ('dbeafe', '1e40af'),
+            'B': ('ede9fe', '5b21b6'),
+            'C': ('fff7ed', 'c2410c'),
+            'G': ('ccfbf1', '0f766e'),
+            'R': ('f1f5f9', '334155')
+        }
         
     @staticmethod
     def get_day_name(year, month, day):
@@ -57,7 +278,150 @@ class DutyScheduler:
     def get_next_shift(self, current_shift):
         return self.shift_rotation.get(current_shift, current_shift)
 
-    def generate_schedule(self, employees_data, year, month):
+    def build_shift_row(self, start_shift, rest_day, first_weekday, num_days, was_rest_day=False):
+        """
+        Build one employee's shift row in closed form
+
+        The rotation only advances on the first working day after a rest day,
+        and rest days fall on a fixed weekday, so the row is a run of the
+        start shift up to the first rest day followed by one rest day and six
+        working days per week, each week on the next shift of the rotation.
+
+        Args:
+            start_shift: The shift the employee is on when the period starts
+            rest_day: The rest weekday (0 = Monday ... 6 = Sunday)
+            first_weekday: The weekday of the first day of the period
+            num_days: The number of days in the period
+            was_rest_day: Whether the previous period ended on a rest day
+
+        Returns:
+            A tuple of (row, current_shift, was_rest_day) where row is a list
+            with one shift code per day and the other two are the rotation
+            state to carry into the next period
+        """
+        if 0 <= rest_day <= 6:
+            first_rest = (rest_day - first_weekday) % 7
+        else:
+            # A rest day outside the week never comes round
+            first_rest = num_days
+
+        current_shift = start_shift
+        if was_rest_day and 0 < first_rest and num_days:
+            # The previous period ended on a rest day
+            current_shift = self.get_next_shift(current_shift)
+        row = [current_shift] * min(first_rest, num_days)
+
+        for day_index in range(first_rest, num_days, 7):
+            row.append('R')
+            working_days = min(6, num_days - day_index - 1)
+            if working_days:
+                current_shift = self.get_next_shift(current_shift)
+                row.extend([current_shift] * working_days)
+
+        if num_days:
+            was_rest_day = first_rest < num_days and (num_days - 1 - first_rest) % 7 == 0
+
+        return row, current_shift, was_rest_day
+
+    def clean_employees(self, employees_data, errors=None):
+        """
+        Validate the raw employee payload in one pass
+
+        Records are dictionaries or tuples of (key, value) pairs. Employee
+        records, already cleaned by an earlier call, are kept as they are.
+        Every record that cannot be scheduled is left out and reported instead
+        of being dropped silently.
+
+        Args:
+            employees_data: List or tuple containing employee data
+            errors: Optional list that receives one dictionary per rejected
+                record, with its row index, name (if any) and the problems found
+
+        Returns:
+            A list of Employee records
+        """
+        if not isinstance(employees_data, (list, tuple)):
+            employees_data = [employees_data]
+        
+        start_shifts = self.start_shifts
+        cleaned_employees = []
+        rejected = []
+        
+        for row_index, emp in enumerate(employees_data):
+            if type(emp) is not dict:
+                if type(emp) is Employee:
+                    cleaned_employees.append(emp)
+                    continue
+                elif isinstance(emp, tuple):
+                    # Tuple of key-value tuples
+                    emp = {item[0]: item[1] for item in emp
+                           if isinstance(item, tuple) and len(item) >= 2}
+                elif not isinstance(emp, dict):
+                    rejected.append({
+                        'row': row_index,
+                        'name': None,
+                        'errors': [f"Unsupported record type {type(emp).__name__}"]
+                    })
+                    continue
+            
+            # Fast path: a complete, well-formed record
+            try:
+                rest_day = emp['rest_day']
+                if type(rest_day) is not int:
+                    rest_day = int(rest_day)
+                start_shift = emp['start_shift']
+                if 0 <= rest_day <= 6 and start_shift in start_shifts:
+                    cleaned_employees.append(Employee(
+                        emp['name'], emp['code'], emp['post'], start_shift, rest_day,
+                        bool(emp.get('locked', False))
+                    ))
+                    continue
+            except (KeyError, ValueError, TypeError):
+                pass
+            
+            rejected.append({
+                'row': row_index,
+                'name': emp.get('name'),
+                'errors': self._record_errors(emp)
+            })
+        
+        if rejected:
+            logger.warning("Rejected %d of %d employee records, first at row %d: %s",
+                           len(rejected), len(employees_data), rejected[0]['row'],
+                           '; '.join(rejected[0]['errors']))
+            if errors is not None:
+                errors.extend(rejected)
+        
+        return cleaned_employees
+
+    def _record_errors(self, emp):
+        """
+        List the problems with an employee record that failed the fast path
+        """
+        problems = []
+        missing = [key for key in Employee.REQUIRED_KEYS if key not in emp]
+        if missing:
+            problems.append(f"Missing required keys: {', '.join(missing)}")
+        
+        if 'rest_day' in emp:
+            try:
+                if not 0 <= int(emp['rest_day']) <= 6:
+                    problems.append(f"rest_day must be between 0 and 6, got {emp['rest_day']!r}")
+            except (ValueError, TypeError):
+                problems.append(f"Invalid rest_day value: {emp['rest_day']!r}")
+        
+        if 'start_shift' in emp:
+            try:
+                valid_shift = emp['start_shift'] in self.start_shifts
+            except TypeError:
+                valid_shift = False
+            if not valid_shift:
+                problems.append(f"Invalid start_shift value: {emp['start_shift']!r}")
+        
+        return problems
+
+    def generate_schedule(self, employees_data, year, month, errors=None, min_coverage=None,
+                          solver_options=None, report=None):
         """
         Generate the duty schedule
         
@@ -65,65 +429,394 @@ class DutyScheduler:
             employees_data: List or tuple containing employee data
             year: The year to generate the schedule for
             month: The month to generate the schedule for
+            errors: Optional list that receives the rejected employee records
+            min_coverage: Optional minimum headcount per shift, see
+                coverage_targets. Start shifts and rest days are then chosen
+                by solve_coverage instead of taken as sent
+            solver_options: Keyword arguments for solve_coverage
+            report: Optional dictionary that receives the solver summary
             
         Returns:
-            A dictionary with the schedule for each employee
+            A Schedule with one row per employee
         """
-        # 1. Debug input information
-        logger.info(f"Input employees_data type: {type(employees_data)}")
-        logger.info(f"Example of employees_data: {str(employees_data)[:200]}")  # Limit output size
+        first_weekday, num_days = calendar.monthrange(year, month)
+        schedule = Schedule(year, month, num_days)
+        with metrics.time_stage('validate'):
+            cleaned_employees = self.clean_employees(employees_data, errors)
+            targets = self.coverage_targets(min_coverage, num_days) if min_coverage else None
         
-        # 2. Ensure we're working with a list
-        if not isinstance(employees_data, list):
-            employees_data = list(employees_data) if isinstance(employees_data, tuple) else [employees_data]
-        
-        # 3. Create a clean list of employee dictionaries
-        cleaned_employees = []
+        # If we have no valid employees, return an empty schedule
+        if not cleaned_employees:
+            logger.error("No valid employees after data cleaning")
+            return schedule
+            
+        logger.debug("Generating schedule with %d valid employees", len(cleaned_employees))
         
-        for emp in employees_data:
-            # If we have a tuple, convert it to a dict
-            if isinstance(emp, tuple):
-                emp_dict = {}
+        if targets:
+            with metrics.time_stage('solve'):
                 try:
-                    # Handle tuple of key-value tuples
-                    for item in emp:
-                        if isinstance(item, tuple) and len(item) >= 2:
-                            key, value = item[0], item[1]
-                            emp_dict[key] = value
+                    cleaned_employees = self.solve_coverage(
+                        cleaned_employees, first_weekday, num_days, targets,
+                        report=report, **(solver_options or {})
+                    )
                 except Exception as e:
-                    logger.error(f"Error converting tuple to dict: {str(e)}, tuple: {emp}")
-                    continue
-            elif isinstance(emp, dict):
-                # Already a dict
-                emp_dict = emp
+                    # The rotation as sent is always a valid schedule
+                    logger.error(f"Coverage solver failed, using the plain rotation: {str(e)}", exc_info=True)
+                    if report is not None:
+                        report.clear()
+                        report.update({'status': 'failed', 'error': str(e)})
+        
+        with metrics.time_stage('schedule'):
+            for emp in cleaned_employees:
+                # Employees with the same pattern share one cached row
+                row = get_shift_pattern(emp.start_shift, emp.weekday, first_weekday, num_days)[0]
+                schedule.set_row(emp.name, emp.code, emp.post, row)
+        
+        if logger.isEnabledFor(logging.DEBUG):
+            cache_info = get_shift_pattern.cache_info()
+            logger.debug("Pattern cache: %d hits, %d misses, %d/%d patterns",
+                         cache_info.hits, cache_info.misses, cache_info.currsize, cache_info.maxsize)
+        
+        return schedule
+
+    def coverage_targets(self, min_coverage, num_days):
+        """
+        Validate minimum headcounts for the coverage solver
+        
+        Args:
+            min_coverage: Dictionary mapping the rotating shifts (A, B, C) to
+                a headcount for every day, or to a list with one per day
+            num_days: The number of days in the period
+            
+        Returns:
+            A dictionary mapping each shift to a list of daily minimums
+            
+        Raises:
+            ValueError: If a shift or headcount is invalid
+        """
+        if not isinstance(min_coverage, dict):
+            raise ValueError("min_coverage must map shifts to headcounts")
+        
+        targets = {}
+        for shift, target in min_coverage.items():
+            if shift not in self.shift_rotation:
+                raise ValueError(f"min_coverage can only set the rotating shifts "
+                                 f"{', '.join(sorted(self.shift_rotation))}, got {shift!r}")
+            if isinstance(target, list):
+                if len(target) != num_days:
+                    raise ValueError(f"min_coverage for {shift} needs {num_days} days, got {len(target)}")
+                daily = [int(count) for count in target]
             else:
-                # Unknown format
-                logger.error(f"Unsupported employee data type: {type(emp)}, value: {emp}")
-                continue
+                daily = [int(target)] * num_days
+            if any(count < 0 for count in daily):
+                raise ValueError(f"min_coverage for {shift} cannot be negative")
+            if any(daily):
+                targets[shift] = daily
+        return targets
+
+    def solve_coverage(self, employees, first_weekday, num_days, targets, time_budget=SOLVER_TIME_BUDGET,
+                       fixed_rest_days=False, report=None):
+        """
+        Choose start shifts and rest days that meet minimum headcounts
+        
+        Every rotating employee follows one of 21 patterns (start shift x rest
+        weekday), so the search works on the number of employees per pattern
+        rather than on employees. Each step takes the days with the largest
+        shortfall, tries moving one employee from any used pattern to a
+        pattern that works the missing shift that day, and repeats the best
+        move while it keeps reducing the total shortfall. When no move helps,
+        it makes a random move that leaves the shortfall unchanged and bars
+        undoing it for a few rounds, so the search can leave a local optimum.
+        It stops when every minimum is met, no move is left, or the time
+        budget runs out. The shortfall never grows, so the assignment kept is
+        the best one found, which is the rotation as sent if nothing helped.
+        
+        Locked employees and the G shift are never moved, and as few
+        employees as possible end up off the pattern they were sent with.
+        
+        Args:
+            employees: List of Employee records
+            first_weekday: The weekday of the first day of the period
+            num_days: The number of days in the period
+            targets: Daily minimums per shift, from coverage_targets
+            time_budget: Seconds the search may take
+            fixed_rest_days: Only change start shifts, keeping every rest day
+            report: Optional dictionary that receives a summary of the search
+            
+        Returns:
+            A list of Employee records in the same order, with new start
+            shifts and rest days where they changed
+        """
+        start_time = time.perf_counter()
+        deadline = start_time + time_budget
+        
+        def pattern_row(key):
+            row = rows.get(key)
+            if row is None:
+                row = rows[key] = get_shift_pattern(key[0], key[1], first_weekday, num_days)[0].decode('ascii')
+            return row
+        
+        rows = {}
+        patterns = [(shift, weekday) for shift in sorted(self.shift_rotation) for weekday in range(7)]
+        coverage = {shift: [0] * num_days for shift in targets}
+        counts = {}
+        fixed_counts = {}
+        for emp in employees:
+            key = (emp.start_shift, emp.weekday)
+            if not emp.locked and emp.start_shift in self.shift_rotation:
+                counts[key] = counts.get(key, 0) + 1
+            else:
+                fixed_counts[key] = fixed_counts.get(key, 0) + 1
+        for pattern_counts in (counts, fixed_counts):
+            for key, count in pattern_counts.items():
+                for day_index, shift in enumerate(pattern_row(key)):
+                    if shift in coverage:
+                        coverage[shift][day_index] += count
+        original_counts = dict(counts)
+        
+        def shortfall():
+            return sum(
+                target - count
+                for shift, daily in targets.items()
+                for target, count in zip(daily, coverage[shift])
+                if target > count
+            )
+        
+        diff_days = {}
+        
+        def move_delta(source, dest):
+            # Change of the total shortfall when one employee moves from source to dest
+            days = diff_days.get((source, dest))
+            if days is None:
+                source_row, dest_row = pattern_row(source), pattern_row(dest)
+                days = diff_days[(source, dest)] = [
+                    (day_index, source_row[day_index], dest_row[day_index])
+                    for day_index in range(num_days) if source_row[day_index] != dest_row[day_index]
+                ]
+            delta = 0
+            for day_index, left, joined in days:
+                if left in targets and coverage[left][day_index] <= targets[left][day_index]:
+                    delta += 1
+                if joined in targets and coverage[joined][day_index] < targets[joined][day_index]:
+                    delta -= 1
+            return delta
+        
+        def apply_move(source, dest):
+            for day_index, left, joined in diff_days[(source, dest)]:
+                if left in coverage:
+                    coverage[left][day_index] -= 1
+                if joined in coverage:
+                    coverage[joined][day_index] += 1
+            counts[source] -= 1
+            counts[dest] = counts.get(dest, 0) + 1
+        
+        initial_shortfall = current_shortfall = shortfall()
+        iterations = 0
+        timed_out = False
+        # Sideways moves recently made, whose reversal is not allowed yet
+        tabu = {}
+        rng = random.Random(0)
+        
+        while current_shortfall and counts:
+            if time.perf_counter() > deadline:
+                timed_out = True
+                break
+            
+            # Try to fill the largest shortfall first, falling back to
+            # smaller ones when no move helps there
+            gaps = sorted(
+                ((target - coverage[shift][day_index], shift, day_index)
+                 for shift, daily in targets.items()
+                 for day_index, target in enumerate(daily)
+                 if target > coverage[shift][day_index]),
+                reverse=True
+            )
+            best = None
+            sideways = []
+            tried = set()
+            for _, shift, day_index in gaps:
+                for dest in patterns:
+                    if dest in tried or pattern_row(dest)[day_index] != shift:
+                        continue
+                    tried.add(dest)
+                    for source, count in counts.items():
+                        if not count or source == dest or (fixed_rest_days and source[1] != dest[1]):
+                            continue
+                        delta = move_delta(source, dest)
+                        if delta < 0:
+                            if best is None or delta < best[0]:
+                                best = (delta, source, dest)
+                        elif delta == 0 and tabu.get((source, dest), -1) < iterations:
+                            sideways.append((source, dest))
+                if best is not None:
+                    break
             
-            # Ensure all required keys are present
-            required_keys = ['name', 'code', 'post', 'start_shift', 'rest_day']
-            if not all(key in emp_dict for key in required_keys):
-                missing = [key for key in required_keys if key not in emp_dict]
-                logger.error(f"Missing required keys {missing} in employee data: {emp_dict}")
+            if best is None:
+                # A local optimum: make a move that keeps the shortfall, so
+                # the next round can look at a different assignment
+                if not sideways:
+                    break
+                source, dest = rng.choice(sideways)
+                move_delta(source, dest)
+                apply_move(source, dest)
+                iterations += 1
+                tabu[(dest, source)] = iterations + SOLVER_TABU_TENURE
                 continue
             
-            # Convert rest_day to int if it's not already
-            try:
-                emp_dict['rest_day'] = int(emp_dict['rest_day'])
-            except (ValueError, TypeError):
-                logger.error(f"Invalid rest_day value: {emp_dict.get('rest_day')}")
+            # Keep making the same move while it helps
+            _, source, dest = best
+            while True:
+                apply_move(source, dest)
+                iterations += 1
+                current_shortfall += best[0]
+                if not counts[source] or not current_shortfall:
+                    break
+                best = (move_delta(source, dest), source, dest)
+                if best[0] >= 0:
+                    break
+        
+        # Keep as many employees as possible on the pattern they were sent with
+        keep = {key: min(count, counts.get(key, 0)) for key, count in original_counts.items()}
+        openings = {}
+        for key, count in counts.items():
+            for _ in range(count - keep.get(key, 0)):
+                openings.setdefault(key[1] if fixed_rest_days else None, []).append(key)
+        
+        assigned = []
+        changes = []
+        for emp in employees:
+            key = (emp.start_shift, emp.weekday)
+            if emp.locked or emp.start_shift not in self.shift_rotation or keep[key]:
+                if not emp.locked and emp.start_shift in self.shift_rotation:
+                    keep[key] -= 1
+                assigned.append(emp)
                 continue
-                
-            cleaned_employees.append(emp_dict)
+            start_shift, weekday = openings[emp.weekday if fixed_rest_days else None].pop()
+            moved = Employee(emp.name, emp.code, emp.post, start_shift,
+                             Employee.rest_day_from_weekday(weekday), emp.locked)
+            assigned.append(moved)
+            changes.append({'name': emp.name, 'start_shift': moved.start_shift, 'rest_day': moved.rest_day})
+        
+        if current_shortfall == 0:
+            status = 'met'
+        elif current_shortfall < initial_shortfall:
+            status = 'improved'
+        else:
+            status = 'unchanged'
+        elapsed = time.perf_counter() - start_time
+        logger.info("Coverage solver %s: shortfall %d -> %d, %d employees moved in %.3f seconds",
+                    status, initial_shortfall, current_shortfall, len(changes), elapsed)
+        
+        if report is not None:
+            report.update({
+                'status': status,
+                'timed_out': timed_out,
+                'initial_shortfall': initial_shortfall,
+                'shortfall': current_shortfall,
+                'shortfall_by_shift': {
+                    shift: [max(0, target - count) for target, count in zip(daily, coverage[shift])]
+                    for shift, daily in targets.items()
+                },
+                'iterations': iterations,
+                'process_time': elapsed,
+                'changes': changes
+            })
+        return assigned
+
+    def generate_schedule_range(self, employees_data, start_date, end_date, errors=None):
+        """
+        Generate the duty schedule for a date range, one month at a time
+        
+        The rotation state of every employee is carried across month
+        boundaries, so a range gives the same shifts as one continuous
+        schedule rather than restarting each month from start_shift.
+        
+        Args:
+            employees_data: List or tuple containing employee data
+            start_date: The first date of the range
+            end_date: The last date of the range (inclusive)
+            errors: Optional list that receives the rejected employee records
+            
+        Yields:
+            A Schedule per month covering the part of the range in that month
+        """
+        with metrics.time_stage('validate'):
+            cleaned_employees = self.clean_employees(employees_data, errors)
+        
+        if not cleaned_employees:
+            logger.error("No valid employees after data cleaning")
+            return
+        
+        logger.info(f"Generating schedule from {start_date} to {end_date} "
+                    f"with {len(cleaned_employees)} valid employees")
+        
+        # Rotation state per employee: (current_shift, was_rest_day, rest_day)
+        state = {}
+        for emp in cleaned_employees:
+            state[emp.name] = (emp.start_shift, False, emp.weekday)
+        
+        window_start = start_date
+        while window_start <= end_date:
+            last_day = calendar.monthrange(window_start.year, window_start.month)[1]
+            window_end = min(end_date, window_start.replace(day=last_day))
+            first_weekday = window_start.weekday()
+            num_days = (window_end - window_start).days + 1
+            
+            schedule = Schedule(window_start.year, window_start.month, num_days, window_start.day)
+            for emp in cleaned_employees:
+                name = emp.name
+                current_shift, was_rest_day, rest_day = state[name]
+                row, current_shift, was_rest_day = get_shift_pattern(
+                    current_shift, rest_day, first_weekday, num_days, was_rest_day
+                )
+                state[name] = (current_shift, was_rest_day, rest_day)
+                schedule.set_row(name, emp.code, emp.post, row)
+            
+            yield schedule
+            
+            window_start = window_end + timedelta(days=1)
+
+    @staticmethod
+    def pattern_cache_info():
+        """
+        Report the shift pattern cache counters
+        
+        Returns:
+            A dictionary with the hits, misses, current size and maximum size
+        """
+        cache_info = get_shift_pattern.cache_info()
+        return {
+            'hits': cache_info.hits,
+            'misses': cache_info.misses,
+            'size': cache_info.currsize,
+            'maxsize': cache_info.maxsize
+        }
+
+    @staticmethod
+    def clear_pattern_cache():
+        get_shift_pattern.cache_clear()
+
+    def generate_schedule_reference(self, employees_data, year, month):
+        """
+        Generate the duty schedule by walking every employee through every day
+
+        This is the original day-by-day rotation loop. It is kept as the
+        reference that generate_schedule must agree with.
+        
+        Args:
+            employees_data: List or tuple containing employee data
+            year: The year to generate the schedule for
+            month: The month to generate the schedule for
+            
+        Returns:
+            A dictionary with the schedule for each employee
+        """
+        cleaned_employees = self.clean_employees(employees_data)
         
-        # If we have no valid employees, return an empty schedule
         if not cleaned_employees:
             logger.error("No valid employees after data cleaning")
             return {}
             
-        # 4. Generate the schedule
-        logger.info(f"Generating schedule with {len(cleaned_employees)} valid employees")
         num_days = calendar.monthrange(year, month)[1]
         schedule = {}
         
@@ -131,525 +824,3587 @@ class DutyScheduler:
         weekdays = [calendar.weekday(year, month, day) for day in range(1, num_days + 1)]
         
         for emp in cleaned_employees:
-            schedule[emp['name']] = {
-                'code': emp['code'],
-                'post': emp['post'],
+            schedule[emp.name] = {
+                'code': emp.code,
+                'post': emp.post,
                 'shifts': []
             }
             
-            current_shift = emp['start_shift']
-            # Convert Sunday from 0 to 6
-            rest_day = 6 if emp['rest_day'] == 0 else emp['rest_day'] - 1
+            current_shift = emp.start_shift
+            rest_day = emp.weekday
             was_rest_day = False
             
             for day_index, day in enumerate(range(1, num_days + 1)):
                 # Check if it's a rest day using pre-calculated weekdays
                 if weekdays[day_index] == rest_day:
-                    schedule[emp['name']]['shifts'].append('R')
+                    schedule[emp.name]['shifts'].append('R')
                     was_rest_day = True
                 else:
                     if was_rest_day and current_shift != 'G':
                         current_shift = self.get_next_shift(current_shift)
                         was_rest_day = False
-                    schedule[emp['name']]['shifts'].append(current_shift)
+                    schedule[emp.name]['shifts'].append(current_shift)
         
         return schedule
 
-@app.route('/')
-def index():
-    try:
-        logger.info("Rendering index page")
-        return render_template('index.html')
-    except Exception as e:
-        logger.error(f"Error rendering index page: {str(e)}")
-        return jsonify({"error": str(e)}), 500
+@lru_cache(maxsize=PATTERN_CACHE_SIZE)
+def get_shift_pattern(start_shift, rest_day, first_weekday, num_days, was_rest_day=False):
+    """
+    Return the cached shift row for one rotation pattern
+    
+    A row only depends on the rotation state it starts from, the rest weekday,
+    the weekday the period starts on and its length, so every month with the
+    same shape shares one entry regardless of its year.
+    
+    Returns:
+        A tuple of (row, current_shift, was_rest_day) where row is a bytes
+        object with one shift code per day
+    """
+    row, current_shift, was_rest_day = DutyScheduler().build_shift_row(
+        start_shift, rest_day, first_weekday, num_days, was_rest_day
+    )
+    return ''.join(row).encode('ascii'), current_shift, was_rest_day
 
-@app.route('/generate', methods=['POST'])
-def generate():
-    try:
-        start_time = datetime.now()
-        data = request.get_json()
-        
-        if not data:
-            logger.warning("No JSON data received")
-            return jsonify({"error": "No data provided"}), 400
-            
-        year = int(data.get('year', datetime.now().year))
-        month = int(data.get('month', datetime.now().month))
-        employees_data = data.get('employees', [])
+class Schedule:
+    """
+    Columnar duty schedule
+    
+    Shifts are kept in one flat buffer with one byte per employee-day, row by
+    row, next to parallel name, code and post lists. Rows and day columns can
+    be read as memoryview slices without copying.
+    
+    Coverage is kept up to date as rows are set: every distinct (post, row)
+    is counted, and since most employees share a cached pattern there are
+    only a few dozen of them, so the shift x day headcount matrix is built in
+    O(patterns x days) rather than by scanning every employee.
+    """
+    __slots__ = ('year', 'month', 'start_day', 'num_days', 'names', 'codes', 'posts', 'cells', '_index',
+                 '_row_counts', '_coverage')
+    
+    # Shifts always present in a coverage matrix, in display order
+    COVERAGE_SHIFTS = ('A', 'B', 'C', 'G', 'R')
+    
+    def __init__(self, year, month, num_days, start_day=1):
+        self.year = year
+        self.month = month
+        self.start_day = start_day
+        self.num_days = num_days
+        self.names = []
+        self.codes = []
+        self.posts = []
+        self.cells = bytearray()
+        self._index = {}
+        self._row_counts = {}
+        self._coverage = {}
+    
+    def __len__(self):
+        return len(self.names)
+    
+    def __iter__(self):
+        """Yield (name, code, post, shifts) for each employee, shifts as a str"""
+        num_days = self.num_days
+        cells = self.cells
+        for index, name in enumerate(self.names):
+            offset = index * num_days
+            yield name, self.codes[index], self.posts[index], cells[offset:offset + num_days].decode('ascii')
+    
+    @property
+    def month_name(self):
+        return calendar.month_name[self.month]
+    
+    @property
+    def days(self):
+        """The day-of-month numbers covered by the schedule"""
+        return range(self.start_day, self.start_day + self.num_days)
+    
+    def index(self, name):
+        return self._index[name]
+    
+    def set_row(self, name, code, post, shifts):
+        """
+        Add an employee row, or replace it if the name is already scheduled
         
-        # Add detailed logging for debugging
-        logger.info(f"Raw data received: {str(data)[:200]}")
-        logger.info(f"Employees data type: {type(employees_data)}")
+        Args:
+            name: The employee name
+            code: The employee code
+            post: The employee post
+            shifts: bytes-like object with one shift code per day
+        """
+        if len(shifts) != self.num_days:
+            raise ValueError(f"Expected {self.num_days} shifts for {name}, got {len(shifts)}")
         
-        if not employees_data:
-            logger.warning("No employee data received")
-            return jsonify({"error": "No employee data provided"}), 400
+        index = self._index.get(name)
+        if index is None:
+            self._index[name] = len(self.names)
+            self.names.append(name)
+            self.codes.append(code)
+            self.posts.append(post)
+            self.cells += shifts
+        else:
+            # Same as re-assigning a dict key: the row keeps its position
+            offset = index * self.num_days
+            self._count_row(self.posts[index], bytes(self.cells[offset:offset + self.num_days]), -1)
+            self.codes[index] = code
+            self.posts[index] = post
+            self.cells[offset:offset + self.num_days] = shifts
+        self._count_row(post, bytes(shifts), 1)
+    
+    def remove_row(self, name):
+        """
+        Remove an employee row, keeping the order of the others
         
-        logger.info(f"Generating schedule for {month}/{year} with {len(employees_data)} employees")
+        Returns:
+            Whether the name was scheduled
+        """
+        index = self._index.pop(name, None)
+        if index is None:
+            return False
+        offset = index * self.num_days
+        self._count_row(self.posts[index], bytes(self.cells[offset:offset + self.num_days]), -1)
+        del self.names[index]
+        del self.codes[index]
+        del self.posts[index]
+        del self.cells[offset:offset + self.num_days]
+        for later_index in range(index, len(self.names)):
+            self._index[self.names[later_index]] = later_index
+        return True
+    
+    def copy(self):
+        """Return an independent copy that can be edited without touching this one"""
+        result = Schedule(self.year, self.month, self.num_days, self.start_day)
+        result.names = list(self.names)
+        result.codes = list(self.codes)
+        result.posts = list(self.posts)
+        result.cells = bytearray(self.cells)
+        result._index = dict(self._index)
+        result._row_counts = dict(self._row_counts)
+        return result
+    
+    def _count_row(self, post, shifts, delta):
+        key = (post, shifts)
+        count = self._row_counts.get(key, 0) + delta
+        if count:
+            self._row_counts[key] = count
+        else:
+            del self._row_counts[key]
+        self._coverage.clear()
+    
+    def coverage(self, post=None):
+        """
+        Return the headcount on each shift for every day
         
-        # Try to see what's in the first employee
-        if employees_data and len(employees_data) > 0:
-            first_emp = employees_data[0]
-            logger.info(f"First employee type: {type(first_emp)}")
-            logger.info(f"First employee data: {first_emp}")
+        Args:
+            post: Only count employees of this post
             
-            # If it's a dictionary, check the keys
-            if isinstance(first_emp, dict):
-                logger.info(f"First employee keys: {first_emp.keys()}")
-        
-        # Generate the schedule
-        scheduler = DutyScheduler()
-        schedule = scheduler.generate_schedule(employees_data, year, month)
+        Returns:
+            A dictionary mapping each shift code to a list with one count per
+            day of the schedule
+        """
+        matrix = self._coverage.get(post)
+        if matrix is None:
+            matrix = {shift: [0] * self.num_days for shift in self.COVERAGE_SHIFTS}
+            for (row_post, shifts), count in self._row_counts.items():
+                if post is not None and row_post != post:
+                    continue
+                for day_index, code in enumerate(shifts.decode('ascii')):
+                    counts = matrix.get(code)
+                    if counts is None:
+                        counts = matrix[code] = [0] * self.num_days
+                    counts[day_index] += count
+            self._coverage[post] = matrix
+        return matrix
+    
+    def headcount(self, shift, day, post=None):
+        """Return how many employees are on a shift on a day of the month"""
+        return self.coverage(post).get(shift, [0] * self.num_days)[day - self.start_day]
+    
+    def row(self, index):
+        """Return the shifts of one employee as a memoryview"""
+        offset = index * self.num_days
+        return memoryview(self.cells)[offset:offset + self.num_days]
+    
+    def day(self, day_index):
+        """Return the shifts of every employee on one day as a memoryview"""
+        return memoryview(self.cells)[day_index::self.num_days]
+    
+    def shifts(self, index):
+        return self.row(index).tobytes().decode('ascii')
+    
+    def to_dict(self, compact=False):
+        """
+        Convert to the {name: {'code', 'post', 'shifts'}} layout used by the API
         
-        # Check if we got an empty schedule (indicates error)
-        if not schedule:
-            logger.error("Generated schedule is empty, likely due to data errors")
-            return jsonify({"error": "Unable to generate schedule due to invalid employee data"}), 400
+        Args:
+            compact: Give each row's shifts as one string, e.g. "AAARCCC...",
+                instead of a list with one string per day
+        """
+        if compact:
+            return {
+                name: {'code': code, 'post': post, 'shifts': shifts}
+                for name, code, post, shifts in self
+            }
+        return {
+            name: {'code': code, 'post': post, 'shifts': list(shifts)}
+            for name, code, post, shifts in self
+        }
+    
+    @classmethod
+    def from_dict(cls, schedule, year, month):
+        """
+        Build a Schedule from the {name: {'code', 'post', 'shifts'}} layout
         
-        end_time = datetime.now()
-        process_time = (end_time - start_time).total_seconds()
-        logger.info(f"Schedule generated in {process_time:.2f} seconds")
+        Raises:
+            ValueError: If a row does not have one single-letter shift per day
+        """
+        num_days = calendar.monthrange(year, month)[1]
+        result = cls(year, month, num_days)
+        for name, emp_data in schedule.items():
+            try:
+                shifts = ''.join(emp_data.get('shifts', [])).encode('ascii')
+            except (TypeError, UnicodeEncodeError):
+                raise ValueError(f"Invalid shifts for {name}")
+            result.set_row(name, emp_data.get('code'), emp_data.get('post'), shifts)
+        return result
+    
+    def content_hash(self):
+        """
+        Return a stable hash of the schedule period and every row
         
-        return jsonify({
-            'schedule': schedule,
-            'month': month,
-            'year': year,
-            'month_name': calendar.month_name[month],
-            'process_time': process_time
-        })
-    except Exception as e:
-        logger.error(f"Error generating schedule: {str(e)}", exc_info=True)
-        return jsonify({"error": str(e)}), 500
+        Two schedules generated from the same employees for the same month
+        get the same hash, so it is used as the schedule ID.
+        """
+        digest = hashlib.sha256()
+        header = [self.year, self.month, self.start_day, self.num_days, self.names, self.codes, self.posts]
+        digest.update(json.dumps(header, separators=(',', ':')).encode('utf-8'))
+        digest.update(self.cells)
+        return digest.hexdigest()[:32]
+    
+    def to_bytes(self):
+        """
+        Serialise to a JSON header line followed by the raw shift buffer
+        """
+        header = {
+            'year': self.year,
+            'month': self.month,
+            'start_day': self.start_day,
+            'num_days': self.num_days,
+            'names': self.names,
+            'codes': self.codes,
+            'posts': self.posts
+        }
+        return json.dumps(header, separators=(',', ':')).encode('utf-8') + b'\n' + bytes(self.cells)
+    
+    @classmethod
+    def from_bytes(cls, data):
+        header, _, cells = data.partition(b'\n')
+        header = json.loads(header)
+        result = cls(header['year'], header['month'], header['num_days'], header['start_day'])
+        result.names = header['names']
+        result.codes = header['codes']
+        result.posts = header['posts']
+        result.cells = bytearray(cells)
+        result._index = {name: index for index, name in enumerate(result.names)}
+        num_days = result.num_days
+        for index, post in enumerate(result.posts):
+            offset = index * num_days
+            key = (post, cells[offset:offset + num_days])
+            result._row_counts[key] = result._row_counts.get(key, 0) + 1
+        return result
 
-@app.route('/export', methods=['POST'])
-def export():
-    try:
-        start_time = datetime.now()
-        data = request.get_json()
+class ScheduleStore:
+    """
+    Bounded store of generated schedules, keyed by schedule ID
+    
+    Recently used schedules are kept in memory. Every schedule is also written
+    to a spool directory so that any gunicorn worker can serve exports for a
+    schedule another worker generated. Both levels evict the least recently
+    used entries once they are full. A schedule that is in neither is looked
+    up with the optional fallback, e.g. one saved in the roster database.
+    """
+    
+    def __init__(self, directory, max_memory=64, max_files=512, fallback=None):
+        self.directory = directory
+        self.max_memory = max_memory
+        self.max_files = max_files
+        self.fallback = fallback
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.fallback_hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+    
+    def _path(self, schedule_id):
+        if not SCHEDULE_ID_PATTERN.fullmatch(schedule_id):
+            return None
+        return os.path.join(self.directory, f'{schedule_id}.schedule')
+    
+    def put(self, schedule):
+        """
+        Store a schedule and return its ID
+        """
+        schedule_id = schedule.content_hash()
+        with self._lock:
+            self._memory[schedule_id] = schedule
+            self._memory.move_to_end(schedule_id)
+            while len(self._memory) > self.max_memory:
+                self._memory.popitem(last=False)
         
-        if not data:
-            logger.warning("No JSON data received for export")
-            return jsonify({"error": "No data provided"}), 400
-            
-        schedule = data.get('schedule', {})
-        month = data.get('month')
-        year = data.get('year')
-        month_name = data.get('month_name')
+        path = self._path(schedule_id)
+        try:
+            # Already spooled: mark it as recently used
+            os.utime(path)
+        except FileNotFoundError:
+            # Not spooled yet, or just evicted by another worker. Write to a
+            # temporary file first so readers never see a partial schedule
+            temp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+            with open(temp_path, 'wb') as f:
+                f.write(schedule.to_bytes())
+            os.replace(temp_path, path)
+            self._evict_files()
+        return schedule_id
+    
+    def get(self, schedule_id):
+        """
+        Return the stored schedule, or None if it is unknown or was evicted
+        """
+        with self._lock:
+            schedule = self._memory.get(schedule_id)
+            if schedule is not None:
+                self.memory_hits += 1
+                self._memory.move_to_end(schedule_id)
+                return schedule
         
-        if not schedule or not month or not year or not month_name:
-            logger.warning("Incomplete schedule data received for export")
-            return jsonify({"error": "Incomplete schedule data provided"}), 400
+        path = self._path(schedule_id)
+        if path is None:
+            self.misses += 1
+            return None
+        try:
+            with open(path, 'rb') as f:
+                schedule = Schedule.from_bytes(f.read())
+            os.utime(path)
+        except FileNotFoundError:
+            schedule = self.fallback(schedule_id) if self.fallback is not None else None
+            if schedule is None:
+                self.misses += 1
+                return None
+            # Spool it again so the other workers find it too; put also
+            # keeps it in memory
+            self.put(schedule)
+            with self._lock:
+                self.fallback_hits += 1
+            return schedule
+        
+        with self._lock:
+            self.disk_hits += 1
+            self._memory[schedule_id] = schedule
+            while len(self._memory) > self.max_memory:
+                self._memory.popitem(last=False)
+        return schedule
+    
+    def put_batch(self, groups):
+        """
+        Store the list of schedules generated by one batch and return its ID
+        
+        Args:
+            groups: List of {'title', 'schedule_id'} dictionaries
+        """
+        manifest = json.dumps(groups, separators=(',', ':')).encode('utf-8')
+        batch_id = hashlib.sha256(manifest).hexdigest()[:32]
+        path = os.path.join(self.directory, f'{batch_id}.batch')
+        temp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(temp_path, 'wb') as f:
+            f.write(manifest)
+        os.replace(temp_path, path)
+        self._evict_files()
+        return batch_id
+    
+    def get_batch(self, batch_id):
+        """
+        Return the {'title', 'schedule_id'} list of a batch, or None if unknown
+        """
+        if not SCHEDULE_ID_PATTERN.fullmatch(batch_id):
+            return None
+        try:
+            with open(os.path.join(self.directory, f'{batch_id}.batch'), 'rb') as f:
+                return json.loads(f.read())
+        except FileNotFoundError:
+            return None
+    
+    def _evict_files(self):
+        entries = []
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.name.endswith(('.schedule', '.batch')):
+                    try:
+                        entries.append((entry.stat().st_mtime, entry.path))
+                    except FileNotFoundError:
+                        pass
+        if len(entries) <= self.max_files:
+            return
+        entries.sort()
+        for _, path in entries[:len(entries) - self.max_files]:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+class RosterStore:
+    """
+    SQLite store of saved rosters and the schedules generated from them
+    
+    The database runs in WAL mode, so requests reading rosters are not
+    blocked while another worker saves one. Each thread opens its own
+    connection on first use. Schedule rows are kept as one packed shift
+    string per employee, e.g. "AAAARCCC...", which is also how Schedule
+    holds them.
+    """
+    
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS rosters (
+            roster_id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            updated_at REAL NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS employees (
+            roster_id INTEGER NOT NULL REFERENCES rosters (roster_id) ON DELETE CASCADE,
+            position INTEGER NOT NULL,
+            name TEXT NOT NULL,
+            code TEXT,
+            post TEXT,
+            start_shift TEXT NOT NULL,
+            rest_day INTEGER NOT NULL,
+            locked INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (roster_id, position)
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS employees_code ON employees (code);
+        CREATE TABLE IF NOT EXISTS schedules (
+            schedule_id TEXT PRIMARY KEY,
+            roster_id INTEGER REFERENCES rosters (roster_id) ON DELETE SET NULL,
+            year INTEGER NOT NULL,
+            month INTEGER NOT NULL,
+            start_day INTEGER NOT NULL,
+            num_days INTEGER NOT NULL,
+            created_at REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS schedules_roster ON schedules (roster_id, year, month);
+        CREATE TABLE IF NOT EXISTS schedule_rows (
+            schedule_id TEXT NOT NULL,
+            position INTEGER NOT NULL,
+            name TEXT NOT NULL,
+            code TEXT,
+            post TEXT,
+            year INTEGER NOT NULL,
+            month INTEGER NOT NULL,
+            shifts TEXT NOT NULL,
+            PRIMARY KEY (schedule_id, position)
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS schedule_rows_post ON schedule_rows (post, year, month);
+    """
+    
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+    
+    def _connect(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.row_factory = sqlite3.Row
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.execute('PRAGMA foreign_keys=ON')
+            connection.executescript(self.SCHEMA)
+            self._local.connection = connection
+        return connection
+    
+    @staticmethod
+    def _employee_rows(roster_id, employees):
+        return [
+            (roster_id, position, emp.name, emp.code, emp.post, emp.start_shift, emp.rest_day, int(emp.locked))
+            for position, emp in enumerate(employees)
+        ]
+    
+    def create_roster(self, name, employees):
+        """
+        Save a roster in one transaction and return its ID
         
-        logger.info(f"Exporting schedule for {month}/{year} with {len(schedule)} employees")
+        Args:
+            name: The roster name
+            employees: List of Employee records, in roster order
+        """
+        connection = self._connect()
+        now = time.time()
+        with connection:
+            cursor = connection.execute(
+                'INSERT INTO rosters (name, created_at, updated_at) VALUES (?, ?, ?)', (name, now, now)
+            )
+            roster_id = cursor.lastrowid
+            connection.executemany(
+                'INSERT INTO employees VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                self._employee_rows(roster_id, employees)
+            )
+        return roster_id
+    
+    def replace_roster(self, roster_id, employees, name=None):
+        """
+        Replace every employee of a roster, and optionally its name
         
-        # Create a BytesIO object to store the Excel file
-        output = BytesIO()
+        Returns:
+            Whether the roster exists
+        """
+        connection = self._connect()
+        with connection:
+            cursor = connection.execute(
+                'UPDATE rosters SET name = COALESCE(?, name), updated_at = ? WHERE roster_id = ?',
+                (name, time.time(), roster_id)
+            )
+            if not cursor.rowcount:
+                return False
+            connection.execute('DELETE FROM employees WHERE roster_id = ?', (roster_id,))
+            connection.executemany(
+                'INSERT INTO employees VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                self._employee_rows(roster_id, employees)
+            )
+        return True
+    
+    def delete_roster(self, roster_id):
+        """
+        Delete a roster and its employees; its schedules are kept
         
-        wb = Workbook()
-        ws = wb.active
+        Returns:
+            Whether the roster existed
+        """
+        connection = self._connect()
+        with connection:
+            cursor = connection.execute('DELETE FROM rosters WHERE roster_id = ?', (roster_id,))
+        return bool(cursor.rowcount)
+    
+    def list_rosters(self):
+        """
+        Return every roster with its employee count, most recently updated first
+        """
+        rows = self._connect().execute("""
+            SELECT r.roster_id, r.name, r.created_at, r.updated_at,
+                   (SELECT COUNT(*) FROM employees e WHERE e.roster_id = r.roster_id) AS employees
+            FROM rosters r
+            ORDER BY r.updated_at DESC
+        """).fetchall()
+        return [dict(row) for row in rows]
+    
+    def get_roster(self, roster_id):
+        """
+        Return a roster with its employees, or None if it does not exist
+        """
+        connection = self._connect()
+        row = connection.execute(
+            'SELECT roster_id, name, created_at, updated_at FROM rosters WHERE roster_id = ?', (roster_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        roster = dict(row)
+        roster['employees'] = self._employees(connection, roster_id)
+        return roster
+    
+    def roster_employees(self, roster_id):
+        """
+        Return the employee records of a roster in order, or None if it does not exist
+        """
+        connection = self._connect()
+        if connection.execute('SELECT 1 FROM rosters WHERE roster_id = ?', (roster_id,)).fetchone() is None:
+            return None
+        return self._employees(connection, roster_id)
+    
+    @staticmethod
+    def _employees(connection, roster_id):
+        rows = connection.execute("""
+            SELECT name, code, post, start_shift, rest_day, locked
+            FROM employees WHERE roster_id = ? ORDER BY position
+        """, (roster_id,)).fetchall()
+        return [
+            {'name': name, 'code': code, 'post': post, 'start_shift': start_shift,
+             'rest_day': rest_day, 'locked': bool(locked)}
+            for name, code, post, start_shift, rest_day, locked in rows
+        ]
+    
+    def find_employees(self, code):
+        """
+        Return every saved employee with a code, with the roster it belongs to
+        """
+        rows = self._connect().execute("""
+            SELECT e.roster_id, r.name AS roster_name, e.name, e.code, e.post, e.start_shift, e.rest_day, e.locked
+            FROM employees e JOIN rosters r ON r.roster_id = e.roster_id
+            WHERE e.code = ?
+            ORDER BY e.roster_id, e.position
+        """, (code,)).fetchall()
+        return [dict(row, locked=bool(row['locked'])) for row in rows]
+    
+    def save_schedule(self, schedule_id, schedule, roster_id=None):
+        """
+        Save a generated schedule, one packed shift string per employee
         
-        # Styles
-        header_fill = PatternFill(start_color="1e3a8a", end_color="1e3a8a", fill_type="solid")
-        subheader_fill = PatternFill(start_color="3b82f6", end_color="3b82f6", fill_type="solid")
-        header_font = Font(color="FFFFFF", bold=True, size=11)
-        title_font = Font(color="FFFFFF", bold=True, size=16)
-        border = Border(
-            left=Side(style='thin', color="000000"),
-            right=Side(style='thin', color="000000"),
-            top=Side(style='thin', color="000000"),
-            bottom=Side(style='thin', color="000000")
+        A schedule ID is a hash of its content, so a schedule that is already
+        saved is left as it is.
+        """
+        connection = self._connect()
+        with connection:
+            cursor = connection.execute(
+                'INSERT OR IGNORE INTO schedules VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (schedule_id, roster_id, schedule.year, schedule.month, schedule.start_day,
+                 schedule.num_days, time.time())
+            )
+            if cursor.rowcount:
+                year, month = schedule.year, schedule.month
+                connection.executemany(
+                    'INSERT INTO schedule_rows VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                    (
+                        (schedule_id, position, name, code, post, year, month, shifts)
+                        for position, (name, code, post, shifts) in enumerate(schedule)
+                    )
+                )
+    
+    def load_schedule(self, schedule_id):
+        """
+        Return a saved schedule, or None if it was never saved
+        """
+        connection = self._connect()
+        header = connection.execute(
+            'SELECT year, month, start_day, num_days FROM schedules WHERE schedule_id = ?', (schedule_id,)
+        ).fetchone()
+        if header is None:
+            return None
+        schedule = Schedule(header['year'], header['month'], header['num_days'], header['start_day'])
+        rows = connection.execute(
+            'SELECT name, code, post, shifts FROM schedule_rows WHERE schedule_id = ? ORDER BY position',
+            (schedule_id,)
         )
-        center_alignment = Alignment(horizontal='center', vertical='center')
-        
-        # Calculate last column letter
-        num_days = calendar.monthrange(int(year), int(month))[1]
-        last_col = get_column_letter(num_days + 3)
-        
-        # Set column widths first
-        ws.column_dimensions['A'].width = 5  # S.R
-        ws.column_dimensions['B'].width = 20  # SUPERVISOR
-        ws.column_dimensions['C'].width = 10  # CODE NO.
-        
-        # Set fixed width for day columns
-        for day in range(1, num_days + 1):
-            col = get_column_letter(day + 3)
-            ws.column_dimensions[col].width = 5
-        
-        # Main Header
-        ws.merge_cells(f'A1:{last_col}1')
-        cell = ws['A1']
-        cell.value = 'BAGASSE YARD SHIFT SCHEDULE'
-        cell.font = title_font
-        cell.fill = header_fill
-        cell.alignment = center_alignment
+        for name, code, post, shifts in rows:
+            schedule.set_row(name, code, post, shifts.encode('ascii'))
+        return schedule
+    
+    def find_schedule_rows(self, post, year, month):
+        """
+        Return the saved schedule rows of one post for one month
+        """
+        rows = self._connect().execute("""
+            SELECT schedule_id, name, code, post, shifts
+            FROM schedule_rows
+            WHERE post = ? AND year = ? AND month = ?
+            ORDER BY schedule_id, position
+        """, (post, year, month)).fetchall()
+        return [dict(row) for row in rows]
+
+roster_store = RosterStore(DATABASE_PATH)
+
+schedule_store = ScheduleStore(
+    SCHEDULE_STORE_DIR,
+    max_memory=SCHEDULE_STORE_SIZE,
+    max_files=SCHEDULE_STORE_MAX_FILES,
+    fallback=roster_store.load_schedule
+)
+
+class ArtifactCache:
+    """
+    LRU cache of rendered export files, bounded by their total size in bytes
+    """
+    
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, key):
+        with self._lock:
+            data = self._entries.get(key)
+            if data is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return data
+    
+    def put(self, key, data):
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.size -= len(previous)
+            self._entries[key] = data
+            self.size += len(data)
+            while self.size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= len(evicted)
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+artifact_cache = ArtifactCache(ARTIFACT_CACHE_BYTES)
+
+def dumps_json(payload):
+    """
+    Encode a payload as compact JSON bytes
+    
+    Keys keep their insertion order, unlike jsonify, so a schedule lists its
+    employees in roster order, the order every export uses. Uses orjson when
+    it is installed and the json module otherwise.
+    """
+    if orjson is not None:
+        return orjson.dumps(payload, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(payload, separators=(',', ':')).encode('utf-8')
+
+def json_response(payload, status=200):
+    """
+    Build a JSON response with dumps_json, for payloads too big for jsonify
+    """
+    return app.response_class(dumps_json(payload), status=status, mimetype='application/json')
+
+class Histogram:
+    """
+    Cumulative histogram with fixed bucket bounds, in the Prometheus layout
+    """
+    
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+    
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+    
+    def samples(self):
+        """
+        Yield (upper bound, cumulative count) pairs, ending with +Inf
+        """
+        total = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            total += count
+            yield bound, total
+
+class Metrics:
+    """
+    Per-worker request counters and timing histograms for /metrics
+    
+    Every gunicorn worker keeps its own numbers, so each series carries the
+    worker's process ID as a label.
+    """
+    
+    STAGE_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+    SIZE_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+    
+    def __init__(self):
+        self.stages = {}
+        self.requests = {}
+        self.payload_bytes = {}
+        self._lock = threading.Lock()
+    
+    def observe_stage(self, stage, seconds):
+        with self._lock:
+            histogram = self.stages.get(stage)
+            if histogram is None:
+                histogram = self.stages[stage] = Histogram(self.STAGE_BUCKETS)
+            histogram.observe(seconds)
+    
+    @contextmanager
+    def time_stage(self, stage):
+        """
+        Time the body of a with block as one observation of a stage
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe_stage(stage, time.perf_counter() - start)
+    
+    def observe_request(self, endpoint, method, status, request_bytes, response_bytes):
+        with self._lock:
+            key = (endpoint, method, status)
+            self.requests[key] = self.requests.get(key, 0) + 1
+            for direction, size in (('request', request_bytes), ('response', response_bytes)):
+                if size is None:
+                    continue
+                histogram = self.payload_bytes.get((endpoint, direction))
+                if histogram is None:
+                    histogram = self.payload_bytes[(endpoint, direction)] = Histogram(self.SIZE_BUCKETS)
+                histogram.observe(size)
+    
+    def render(self):
+        """
+        Render every metric in the Prometheus text exposition format
+        """
+        worker = f'worker="{os.getpid()}"'
+        lines = []
         
-        ws.merge_cells(f'A2:{last_col}2')
-        cell = ws['A2']
-        cell.value = f"{month_name.upper()} {year}"
-        cell.font = title_font
-        cell.fill = header_fill
-        cell.alignment = center_alignment
+        def metric(name, kind, help_text):
+            lines.append(f'# HELP duty_scheduler_{name} {help_text}')
+            lines.append(f'# TYPE duty_scheduler_{name} {kind}')
         
-        # Column Headers
-        ws['A3'] = 'S.R'
-        ws['B3'] = 'SUPERVISOR'
-        ws['C3'] = 'CODE NO.'
-        
-        # Day headers (1, 2, 3...)
-        for day in range(1, num_days + 1):
-            col = get_column_letter(day + 3)
-            ws[f'{col}3'] = str(day)
-            ws[f'{col}3'].font = header_font
-            ws[f'{col}3'].fill = subheader_fill
-            ws[f'{col}3'].alignment = center_alignment
-            ws[f'{col}3'].border = border
-            
-            # Get the weekday name (Monday, Tuesday...)
-            weekday_name = DutyScheduler.get_day_name(int(year), int(month), day)
-            ws[f'{col}4'] = weekday_name[:3].upper()  # Using first 3 letters (MON, TUE...)
-            ws[f'{col}4'].font = header_font
-            ws[f'{col}4'].fill = subheader_fill
-            ws[f'{col}4'].alignment = center_alignment
-            ws[f'{col}4'].border = border
-        
-        # Apply styles to header row
-        for col_letter in ['A', 'B', 'C']:
-            ws[f'{col_letter}3'].font = header_font
-            ws[f'{col_letter}3'].fill = subheader_fill
-            ws[f'{col_letter}3'].alignment = center_alignment
-            ws[f'{col_letter}3'].border = border
-            
-            # Weekday name row style
-            ws[f'{col_letter}4'].font = header_font
-            ws[f'{col_letter}4'].fill = subheader_fill
-            ws[f'{col_letter}4'].alignment = center_alignment
-            ws[f'{col_letter}4'].border = border
-        
-        # Fill data rows
-        row_index = 5
-        sr_no = 1
-        
-        for name, data in schedule.items():
-            ws[f'A{row_index}'] = sr_no
-            ws[f'B{row_index}'] = name
-            ws[f'C{row_index}'] = data['code']
-            
-            shifts = data.get('shifts', [])
-            for day, shift in enumerate(shifts, start=1):
-                col = get_column_letter(day + 3)
-                ws[f'{col}{row_index}'] = shift
-                ws[f'{col}{row_index}'].alignment = center_alignment
-                ws[f'{col}{row_index}'].border = border
-            
-            # Apply styles to the employee row
-            for col_letter in ['A', 'B', 'C']:
-                ws[f'{col_letter}{row_index}'].alignment = center_alignment
-                ws[f'{col_letter}{row_index}'].border = border
+        def histogram_lines(name, labels, histogram):
+            for bound, count in histogram.samples():
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f'duty_scheduler_{name}_bucket{{{labels},le="{le}"}} {count}')
+            lines.append(f'duty_scheduler_{name}_sum{{{labels}}} {histogram.sum}')
+            lines.append(f'duty_scheduler_{name}_count{{{labels}}} {histogram.count}')
+        
+        with self._lock:
+            metric('requests_total', 'counter', 'Requests handled, by endpoint, method and status')
+            for (endpoint, method, status), count in sorted(self.requests.items()):
+                lines.append(f'duty_scheduler_requests_total{{{worker},endpoint="{endpoint}",'
+                             f'method="{method}",status="{status}"}} {count}')
             
-            row_index += 1
-            sr_no += 1
+            metric('stage_seconds', 'histogram', 'Time spent in each processing stage')
+            for stage, histogram in sorted(self.stages.items()):
+                histogram_lines('stage_seconds', f'{worker},stage="{stage}"', histogram)
             
-        # Add legend for shift codes
-        legend_row = row_index + 2
-        ws[f'A{legend_row}'] = 'Shift Legend:'
-        ws[f'A{legend_row}'].font = Font(bold=True)
-        
-        legend_items = [
-            ('A', 'Morning Shift (06:00-14:00)'),
-            ('B', 'Afternoon Shift (14:00-22:00)'),
-            ('C', 'Night Shift (22:00-06:00)'),
-            ('G', 'General Shift (09:00-17:00)'),
-            ('R', 'Rest Day')
-        ]
-        
-        for i, (code, description) in enumerate(legend_items):
-            ws[f'A{legend_row + i + 1}'] = f'{code} - {description}'
+            metric('payload_bytes', 'histogram', 'Request and response body sizes')
+            for (endpoint, direction), histogram in sorted(self.payload_bytes.items()):
+                histogram_lines('payload_bytes', f'{worker},endpoint="{endpoint}",direction="{direction}"',
+                                histogram)
         
-        # Save the Excel file
-        wb.save(output)
-        output.seek(0)
+        pattern_cache = DutyScheduler.pattern_cache_info()
+        caches = (
+            ('pattern', pattern_cache['hits'], pattern_cache['misses']),
+            ('artifact', artifact_cache.hits, artifact_cache.misses),
+            # Schedules only found through the fallback were missing from the store
+            ('schedule_store', schedule_store.memory_hits + schedule_store.disk_hits,
+             schedule_store.misses + schedule_store.fallback_hits)
+        )
+        metric('cache_hits_total', 'counter', 'Cache lookups that found an entry')
+        for cache, hits, _ in caches:
+            lines.append(f'duty_scheduler_cache_hits_total{{{worker},cache="{cache}"}} {hits}')
+        metric('cache_misses_total', 'counter', 'Cache lookups that missed')
+        for cache, _, misses in caches:
+            lines.append(f'duty_scheduler_cache_misses_total{{{worker},cache="{cache}"}} {misses}')
+        metric('cache_hit_ratio', 'gauge', 'Share of cache lookups that found an entry')
+        for cache, hits, misses in caches:
+            ratio = hits / (hits + misses) if hits + misses else 0.0
+            lines.append(f'duty_scheduler_cache_hit_ratio{{{worker},cache="{cache}"}} {ratio:.4f}')
         
-        end_time = datetime.now()
-        process_time = (end_time - start_time).total_seconds()
-        logger.info(f"Excel export completed in {process_time:.2f} seconds")
+        metric('schedule_store_disk_hits_total', 'counter', 'Stored schedules loaded from the spool directory')
+        lines.append(f'duty_scheduler_schedule_store_disk_hits_total{{{worker}}} {schedule_store.disk_hits}')
+        metric('schedule_store_database_hits_total', 'counter',
+               'Stored schedules missing from the store and loaded from the roster database')
+        lines.append(f'duty_scheduler_schedule_store_database_hits_total{{{worker}}} {schedule_store.fallback_hits}')
+        metric('pattern_cache_size', 'gauge', 'Shift patterns currently cached')
+        lines.append(f'duty_scheduler_pattern_cache_size{{{worker}}} {pattern_cache["size"]}')
+        metric('artifact_cache_bytes', 'gauge', 'Size of the rendered exports currently cached')
+        lines.append(f'duty_scheduler_artifact_cache_bytes{{{worker}}} {artifact_cache.size}')
         
-        return send_file(
-            output,
-            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-            as_attachment=True,
-            download_name=f'duty_schedule_{month_name}_{year}.xlsx'
-        )
+        metric('import_seconds', 'gauge', 'Time spent importing the app and each export backend')
+        for module_name, seconds in sorted(IMPORT_TIMES.items()):
+            lines.append(f'duty_scheduler_import_seconds{{{worker},module="{module_name}"}} {seconds:.6f}')
         
+        return '\n'.join(lines) + '\n'
+
+metrics = Metrics()
+
+@app.after_request
+def record_request_metrics(response):
+    # Streamed responses have no length up front and are left out of the sizes
+    metrics.observe_request(
+        request.endpoint or 'unknown',
+        request.method,
+        response.status_code,
+        request.content_length,
+        response.content_length
+    )
+    return response
+
+def make_compressor(encoding):
+    """
+    Return (compress, flush) functions for an incremental encoder
+    
+    compress(chunk) returns whatever output is ready for the chunk, flushed
+    so a client can decode it straight away; flush() ends the stream.
+    """
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=min(COMPRESS_LEVEL, 11))
+        return (lambda chunk: compressor.process(chunk) + compressor.flush()), compressor.finish
+    
+    # wbits 31 writes a gzip header and trailer around the deflate stream
+    compressor = zlib.compressobj(COMPRESS_LEVEL, zlib.DEFLATED, 31)
+    return (lambda chunk: compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)), compressor.flush
+
+def compress_stream(chunks, encoding):
+    compress, flush = make_compressor(encoding)
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode('utf-8')
+        if chunk:
+            yield compress(chunk)
+    yield flush()
+
+@app.after_request
+def compress_response(response):
+    """
+    Compress JSON and NDJSON responses for clients that accept it
+    
+    Buffered responses are compressed in one go. Streamed responses are
+    compressed chunk by chunk and flushed after every chunk, so they still
+    arrive as they are produced. Excel and PDF files are zip and deflate
+    compressed already and are left alone.
+    """
+    if (response.status_code != 200 or request.method == 'HEAD'
+            or response.mimetype not in COMPRESSIBLE_MIMETYPES
+            or 'Content-Encoding' in response.headers):
+        return response
+    
+    accepted = request.accept_encodings
+    if brotli is not None and accepted['br']:
+        encoding = 'br'
+    elif accepted['gzip']:
+        encoding = 'gzip'
+    else:
+        return response
+    
+    response.vary.add('Accept-Encoding')
+    if response.is_streamed:
+        response.response = compress_stream(response.response, encoding)
+        response.headers.pop('Content-Length', None)
+    else:
+        data = response.get_data()
+        if len(data) < COMPRESS_MIN_BYTES:
+            return response
+        compress, flush = make_compressor(encoding)
+        response.set_data(compress(data) + flush())
+    response.headers['Content-Encoding'] = encoding
+    return response
+
+@app.route('/')
+def index():
+    try:
+        logger.debug("Rendering index page")
+        return render_template('index.html')
     except Exception as e:
-        logger.error(f"Error exporting to Excel: {str(e)}")
+        logger.error(f"Error rendering index page: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
-@app.route('/debug_data', methods=['POST'])
-def debug_data():
+def schedule_lines(summary, schedule, compact=False):
     """
-    Debug endpoint to check the structure of received employee data
+    Yield a schedule as NDJSON: the summary line, then one line per employee
+    
+    Lines are grouped into chunks of STREAM_CHUNK_EMPLOYEES employees, so
+    the first bytes go out as soon as the first chunk is encoded rather than
+    after the whole roster.
+    """
+    yield dumps_json(summary) + b'\n'
+    
+    chunk = []
+    for name, code, post, shifts in schedule:
+        chunk.append(dumps_json({
+            'name': name,
+            'code': code,
+            'post': post,
+            'shifts': shifts if compact else list(shifts)
+        }))
+        if len(chunk) >= STREAM_CHUNK_EMPLOYEES:
+            yield b'\n'.join(chunk) + b'\n'
+            chunk = []
+    if chunk:
+        yield b'\n'.join(chunk) + b'\n'
+
+@app.route('/generate', methods=['POST'])
+def generate():
+    """
+    Generate the schedule for one month
+    
+    Returns the schedule as JSON. With stream set, it is sent as NDJSON
+    instead: a summary line followed by one line per employee.
     """
     try:
+        start_time = time.perf_counter()
         data = request.get_json()
+        parsed_time = time.perf_counter()
+        
         if not data:
+            logger.warning("No JSON data received")
             return jsonify({"error": "No data provided"}), 400
             
+        try:
+            year = int(data.get('year', datetime.now().year))
+            month = int(data.get('month', datetime.now().month))
+            num_days = calendar.monthrange(year, month)[1]
+        except (TypeError, ValueError) as e:
+            logger.warning(f"Invalid year or month: {str(e)}")
+            return jsonify({"error": f"Invalid year or month: {str(e)}"}), 400
         employees_data = data.get('employees', [])
+        compact = bool(data.get('compact'))
+        stream = bool(data.get('stream'))
+        
+        log_payload_sample('generate', data)
+        
+        # A saved roster can be generated by ID instead of sending every employee
+        # The schedule is only linked to the roster when it was generated from it
+        roster_id = data.get('roster_id')
+        if roster_id is not None and employees_data:
+            roster_id = None
+        if roster_id is not None:
+            try:
+                roster_id = int(roster_id)
+            except (TypeError, ValueError):
+                logger.warning(f"Invalid roster ID: {roster_id!r}")
+                return jsonify({"error": "roster_id must be an integer"}), 400
+            employees_data = roster_store.roster_employees(roster_id)
+            if employees_data is None:
+                logger.warning(f"Roster {roster_id} not found")
+                return jsonify({"error": "Roster not found"}), 404
+        
         if not employees_data:
+            logger.warning("No employee data received")
             return jsonify({"error": "No employee data provided"}), 400
         
-        result = {
-            'data_type': str(type(employees_data)),
-            'length': len(employees_data),
-            'first_item_type': str(type(employees_data[0])) if employees_data else None,
-            'first_item': employees_data[0] if employees_data else None,
-            'all_items': employees_data
+        # Optional minimum headcounts, met by the coverage solver within a
+        # time budget (seconds, capped at SOLVER_TIME_BUDGET)
+        scheduler = DutyScheduler()
+        min_coverage = data.get('min_coverage')
+        time_budget = data.get('time_budget', SOLVER_TIME_BUDGET)
+        try:
+            if min_coverage:
+                scheduler.coverage_targets(min_coverage, num_days)
+            try:
+                time_budget = float(time_budget)
+            except (TypeError, ValueError):
+                pass
+            # Also rejects NaN, which compares false
+            if not isinstance(time_budget, float) or not time_budget > 0:
+                raise ValueError(f"time_budget must be a positive number of seconds, got {time_budget!r}")
+        except (TypeError, ValueError) as e:
+            logger.warning(f"Invalid coverage solver options: {str(e)}")
+            return jsonify({"error": str(e)}), 400
+        solver_options = {
+            'time_budget': min(time_budget, SOLVER_TIME_BUDGET),
+            'fixed_rest_days': bool(data.get('fixed_rest_days'))
         }
         
-        return jsonify(result)
+        # Generate the schedule
+        errors = []
+        solver_report = {}
+        schedule = scheduler.generate_schedule(
+            employees_data, year, month, errors, min_coverage, solver_options, solver_report
+        )
+        generated_time = time.perf_counter()
+        
+        # Check if we got an empty schedule (indicates error)
+        if not schedule:
+            logger.error("Generated schedule is empty, likely due to data errors")
+            return jsonify({
+                "error": "Unable to generate schedule due to invalid employee data",
+                "errors": errors
+            }), 400
+        
+        # Keep the schedule so exports can be rendered without re-uploading it
+        schedule_id = schedule_store.put(schedule)
+        if roster_id is not None:
+            roster_store.save_schedule(schedule_id, schedule, roster_id)
+        stored_time = time.perf_counter()
+        process_time = stored_time - start_time
+        
+        summary = {
+            'schedule_id': schedule_id,
+            'month': month,
+            'year': year,
+            'month_name': calendar.month_name[month],
+            'process_time': process_time,
+            'errors': errors,
+            'coverage': schedule.coverage()
+        }
+        if roster_id is not None:
+            summary['roster_id'] = roster_id
+        if solver_report:
+            summary['solver'] = solver_report
+        if stream:
+            # The first line is the summary, then one line per employee
+            summary['employees'] = len(schedule)
+            response = Response(schedule_lines(summary, schedule, compact), mimetype='application/x-ndjson')
+        else:
+            summary['schedule'] = schedule.to_dict(compact)
+            response = json_response(summary)
+        end_time = time.perf_counter()
+        
+        metrics.observe_stage('parse', parsed_time - start_time)
+        metrics.observe_stage('store', stored_time - generated_time)
+        if not stream:
+            metrics.observe_stage('serialize', end_time - stored_time)
+        
+        # One summary line per request
+        log_event(
+            'generate',
+            schedule_id=schedule_id,
+            period=f'{year}-{month:02d}',
+            employees=len(employees_data),
+            rejected=len(errors),
+            streamed=stream,
+            parse_ms=round((parsed_time - start_time) * 1000, 2),
+            generate_ms=round((generated_time - parsed_time) * 1000, 2),
+            store_ms=round((stored_time - generated_time) * 1000, 2),
+            serialize_ms=round((end_time - stored_time) * 1000, 2),
+            total_ms=round((end_time - start_time) * 1000, 2)
+        )
+        return response
     except Exception as e:
+        logger.error(f"Error generating schedule: {str(e)}", exc_info=True)
         return jsonify({"error": str(e)}), 500
 
-@app.route('/export_pdf', methods=['POST'])
-def export_pdf():
+@app.route('/generate/<schedule_id>/delta', methods=['POST'])
+def generate_delta(schedule_id):
     """
-    Export the schedule as a PDF file with attractive styling
+    Apply added, edited and removed employees to a generated schedule
+    
+    Only the changed rows are built; every other row is copied from the
+    stored schedule. The result is stored as a new schedule, and the
+    response carries its ID, the changed rows and the new coverage.
+    
+    Expected JSON: {"upsert": [employee, ...], "remove": [name, ...]}.
+    An upserted employee replaces the row with the same name, or is added
+    at the end.
     """
     try:
-        start_time = datetime.now()
+        start_time = time.perf_counter()
         data = request.get_json()
-        
         if not data:
-            logger.warning("No JSON data received for PDF export")
+            logger.warning("No JSON data received")
             return jsonify({"error": "No data provided"}), 400
-            
-        schedule = data.get('schedule', {})
-        month = data.get('month')
-        year = data.get('year')
-        month_name = data.get('month_name')
         
-        if not schedule or not month or not year or not month_name:
-            logger.warning("Incomplete schedule data received for PDF export")
-            return jsonify({"error": "Incomplete schedule data provided"}), 400
+        base = schedule_store.get(schedule_id)
+        if base is None:
+            logger.warning(f"Schedule {schedule_id} not found for delta")
+            return jsonify({"error": "Schedule not found"}), 404
         
-        logger.info(f"Exporting PDF schedule for {month}/{year} with {len(schedule)} employees")
+        upsert = data.get('upsert') or []
+        remove = data.get('remove') or []
+        compact = bool(data.get('compact'))
+        if not isinstance(upsert, list) or not isinstance(remove, list):
+            return jsonify({"error": "upsert and remove must be lists"}), 400
+        if not all(isinstance(emp, dict) for emp in upsert):
+            return jsonify({"error": "Every upsert entry must be an employee object"}), 400
+        if not all(isinstance(name, str) for name in remove):
+            return jsonify({"error": "Every remove entry must be an employee name"}), 400
         
-        # Get the post name from the first employee (all employees will have same post)
-        first_employee = next(iter(schedule.values()))
-        post_name = first_employee.get('post', 'SUPERVISOR')
-        
-        # Create a PDF file in memory
-        pdf_output = BytesIO()
-        
-        # Create the PDF document with adjusted margins
-        doc = SimpleDocTemplate(
-            pdf_output,
-            pagesize=landscape(A4),
-            rightMargin=10,
-            leftMargin=10,
-            topMargin=20,
-            bottomMargin=20
-        )
+        errors = []
+        employees = DutyScheduler().clean_employees(upsert, errors) if upsert else []
         
-        # Get available page width and height
-        page_width = landscape(A4)[0] - doc.rightMargin - doc.leftMargin
-        page_height = landscape(A4)[1] - doc.topMargin - doc.bottomMargin
+        schedule = base.copy()
+        removed = [name for name in remove if schedule.remove_row(name)]
         
-        elements = []
+        # New rows start the rotation on the schedule's first day, as in /generate
+        first_weekday = calendar.weekday(schedule.year, schedule.month, schedule.start_day)
+        for emp in employees:
+            row = get_shift_pattern(emp.start_shift, emp.weekday, first_weekday, schedule.num_days)[0]
+            schedule.set_row(emp.name, emp.code, emp.post, row)
         
-        # Add attractive title
-        styles = getSampleStyleSheet()
-        title_style = ParagraphStyle(
-            'CustomTitle',
-            parent=styles['Title'],
-            fontSize=14,
-            spaceAfter=20,
-            alignment=1
-        )
+        if not len(schedule):
+            return jsonify({"error": "The schedule would have no employees left", "errors": errors}), 400
         
-        title = Paragraph(
-            f"<b>BAGASSE YARD SHIFT SCHEDULE - {post_name}</b><br/>{month_name.upper()} {year}",
-            title_style
-        )
-        elements.append(title)
+        new_schedule_id = schedule_store.put(schedule)
         
-        # Prepare table data
-        num_days = calendar.monthrange(int(year), int(month))[1]
-        table_data = []
+        rows = {}
+        for emp in employees:
+            index = schedule.index(emp.name)
+            shifts = schedule.shifts(index)
+            rows[emp.name] = {
+                'code': schedule.codes[index],
+                'post': schedule.posts[index],
+                'shifts': shifts if compact else list(shifts)
+            }
         
-        # Headers row
-        headers = ['SR', 'NAME', 'CD']  # Shortened headers
-        headers.extend([str(day) for day in range(1, num_days + 1)])
-        table_data.append(headers)
-        
-        # Day names row
-        day_names = ['', '', '']  # Empty cells for SR, NAME, CD
-        day_names.extend([DutyScheduler.get_day_name(int(year), int(month), day)[:3] 
-                         for day in range(1, num_days + 1)])
-        table_data.append(day_names)
-
-        # Create post name cell with custom style
-        post_style = ParagraphStyle(
-            'PostStyle',
-            parent=styles['Normal'],
-            fontSize=10,  # Larger font size for post name
-            textColor=colors.white,
-            alignment=1,
-            fontName='Helvetica-Bold'
+        process_time = time.perf_counter() - start_time
+        log_event(
+            'generate_delta',
+            schedule_id=new_schedule_id,
+            base_schedule_id=schedule_id,
+            upserted=len(rows),
+            removed=len(removed),
+            rejected=len(errors),
+            employees=len(schedule),
+            total_ms=round(process_time * 1000, 2)
         )
-        post_cell = Paragraph(f"<b>{post_name}</b>", post_style)
-        table_data[1][1] = post_cell  # Replace the second cell in day names row with styled post name
+        return json_response({
+            'schedule_id': new_schedule_id,
+            'base_schedule_id': schedule_id,
+            'month': schedule.month,
+            'year': schedule.year,
+            'month_name': schedule.month_name,
+            'employees': len(schedule),
+            'rows': rows,
+            'removed': removed,
+            'coverage': schedule.coverage(),
+            'errors': errors,
+            'process_time': process_time
+        })
+    except Exception as e:
+        logger.error(f"Error applying schedule delta: {str(e)}", exc_info=True)
+        return jsonify({"error": str(e)}), 500
 
-        # Employee data rows
-        sr_no = 1
-        for name, emp_data in schedule.items():
-            row = [sr_no, name, emp_data['code']]
-            row.extend(emp_data.get('shifts', []))
-            table_data.append(row)
-            sr_no += 1
+@app.route('/coverage/<schedule_id>')
+def coverage(schedule_id):
+    """
+    Headcount per shift per day of a generated schedule
+    
+    Query parameters narrow the answer: post counts only that post, shift
+    returns one shift's counts, and day (with shift) a single number, e.g.
+    /coverage/<id>?shift=C&day=14 for how many are on C shift on the 14th.
+    """
+    try:
+        schedule = schedule_store.get(schedule_id)
+        if schedule is None:
+            logger.warning(f"Schedule {schedule_id} not found for coverage")
+            return jsonify({"error": "Schedule not found"}), 404
         
-        # Calculate optimal column widths
-        name_col_width = page_width * 0.15  # 15% for name
-        sr_col_width = page_width * 0.04   # 4% for serial number
-        code_col_width = page_width * 0.04  # 4% for code
-        remaining_width = page_width - (name_col_width + sr_col_width + code_col_width)
-        day_width = remaining_width / num_days
+        post = request.args.get('post')
+        shift = request.args.get('shift')
+        day = request.args.get('day', type=int)
         
-        col_widths = [sr_col_width, name_col_width, code_col_width]
-        col_widths.extend([day_width] * num_days)
+        if day is not None and not schedule.start_day <= day < schedule.start_day + schedule.num_days:
+            return jsonify({"error": f"Day must be between {schedule.start_day} and "
+                                     f"{schedule.start_day + schedule.num_days - 1}"}), 400
         
-        # Create table with optimized settings
-        table = Table(table_data, colWidths=col_widths, rowHeights=[20]*len(table_data))
-        
-        # Style the table with attractive formatting
-        table_style = TableStyle([
-            # Headers
-            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#1e3a8a')),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 7),
-            ('ALIGN', (0, 0), (-1, 0), 'CENTER'),
-            
-            # Day names row with darker background for post name
-            ('BACKGROUND', (0, 1), (-1, 1), colors.HexColor('#1e3a8a')),  # Darker blue background
-            ('TEXTCOLOR', (0, 1), (-1, 1), colors.white),
-            ('FONTNAME', (0, 1), (-1, 1), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 1), (-1, 1), 6),
-            ('ALIGN', (0, 1), (-1, 1), 'CENTER'),
-            
-            # Data rows
-            ('FONTNAME', (0, 2), (-1, -1), 'Helvetica'),
-            ('FONTSIZE', (0, 2), (-1, -1), 7),  # Slightly larger font for data
-            ('ALIGN', (0, 2), (-1, -1), 'CENTER'),  # Center all data
-            
-            # Grid styling
-            ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor('#cbd5e1')),  # Lighter grid color
-            ('LINEABOVE', (0, 0), (-1, 0), 1, colors.HexColor('#1e3a8a')),  # Thicker top border
-            ('LINEBELOW', (0, 1), (-1, 1), 1, colors.HexColor('#3b82f6')),  # Thicker header bottom border
-            
-            # Cell alignment and padding
-            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-            ('TOPPADDING', (0, 0), (-1, -1), 1),
-            ('BOTTOMPADDING', (0, 0), (-1, -1), 1),
-            ('LEFTPADDING', (0, 0), (-1, -1), 2),
-            ('RIGHTPADDING', (0, 0), (-1, -1), 2),
-            
-            # Zebra striping for better readability
-            ('ROWBACKGROUNDS', (0, 2), (-1, -1), [colors.HexColor('#f8fafc'), colors.white]),
-        ])
+        matrix = schedule.coverage(post)
+        result = {
+            'schedule_id': schedule_id,
+            'month': schedule.month,
+            'year': schedule.year,
+            'post': post
+        }
+        if shift is not None:
+            result['shift'] = shift
+            if day is not None:
+                result['day'] = day
+                result['count'] = schedule.headcount(shift, day, post)
+            else:
+                result['days'] = list(schedule.days)
+                result['counts'] = matrix.get(shift, [0] * schedule.num_days)
+        elif day is not None:
+            result['day'] = day
+            result['counts'] = {code: counts[day - schedule.start_day] for code, counts in matrix.items()}
+        else:
+            result['days'] = list(schedule.days)
+            result['coverage'] = matrix
+        return json_response(result)
+    except Exception as e:
+        logger.error(f"Error reading coverage: {str(e)}", exc_info=True)
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/generate_range', methods=['POST'])
+def generate_range():
+    """
+    Generate the schedule for a date range and stream it month by month
+    
+    Accepts either start_date and end_date (YYYY-MM-DD) or a year for a full
+    calendar year. Each line of the response is one month as JSON. With
+    compact set, each row's shifts are sent as one string as in /generate.
+    """
+    try:
+        data = request.get_json()
         
-        # Add shift-specific styles
-        for row in range(2, len(table_data)):
-            for col in range(3, len(table_data[row])):
-                shift = table_data[row][col]
-                if shift == 'A':
-                    table_style.add('BACKGROUND', (col, row), (col, row), colors.HexColor('#dbeafe'))
-                    table_style.add('TEXTCOLOR', (col, row), (col, row), colors.HexColor('#1e40af'))
-                elif shift == 'B':
-                    table_style.add('BACKGROUND', (col, row), (col, row), colors.HexColor('#ede9fe'))
-                    table_style.add('TEXTCOLOR', (col, row), (col, row), colors.HexColor('#5b21b6'))
-                elif shift == 'C':
-                    table_style.add('BACKGROUND', (col, row), (col, row), colors.HexColor('#fff7ed'))
-                    table_style.add('TEXTCOLOR', (col, row), (col, row), colors.HexColor('#c2410c'))
-                elif shift == 'G':
-                    table_style.add('BACKGROUND', (col, row), (col, row), colors.HexColor('#ccfbf1'))
-                    table_style.add('TEXTCOLOR', (col, row), (col, row), colors.HexColor('#0f766e'))
-                elif shift == 'R':
-                    table_style.add('BACKGROUND', (col, row), (col, row), colors.HexColor('#f1f5f9'))
-                    table_style.add('TEXTCOLOR', (col, row), (col, row), colors.HexColor('#334155'))
-                table_style.add('FONTNAME', (col, row), (col, row), 'Helvetica-Bold')
+        if not data:
+            logger.warning("No JSON data received")
+            return jsonify({"error": "No data provided"}), 400
         
-        table.setStyle(table_style)
-        elements.append(table)
+        employees_data = data.get('employees', [])
+        if not employees_data:
+            logger.warning("No employee data received")
+            return jsonify({"error": "No employee data provided"}), 400
         
-        # Add legend
-        elements.append(Spacer(1, 10))
-        
-        # Create legend table with simple text
-        legend_data = [
-            ['Shift Legend:', '', '', '', ''],
-            [
-                'A - Morning (06:00-14:00)',
-                'B - Afternoon (14:00-22:00)',
-                'C - Night (22:00-06:00)',
-                'G - General (09:00-17:00)',
-                'R - Rest Day'
-            ]
-        ]
+        try:
+            if data.get('start_date') or data.get('end_date'):
+                start_date = date.fromisoformat(data['start_date'])
+                end_date = date.fromisoformat(data['end_date'])
+            else:
+                year = int(data.get('year', datetime.now().year))
+                start_date = date(year, 1, 1)
+                end_date = date(year, 12, 31)
+        except (KeyError, TypeError, ValueError) as e:
+            return jsonify({"error": f"Invalid date range: {str(e)}"}), 400
         
-        legend_table = Table(legend_data, colWidths=[page_width/5]*5, rowHeights=[12, 15])
+        if end_date < start_date:
+            return jsonify({"error": "end_date must not be before start_date"}), 400
         
-        # Style the legend with colors directly in the table style
-        legend_style = TableStyle([
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-            ('FONTNAME', (0, 0), (-1, -1), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, -1), 8),
-            # Add matching colors and backgrounds for each shift in the legend
-            ('BACKGROUND', (0, 1), (0, 1), colors.HexColor('#dbeafe')),
-            ('TEXTCOLOR', (0, 1), (0, 1), colors.HexColor('#1e40af')),
-            ('BACKGROUND', (1, 1), (1, 1), colors.HexColor('#ede9fe')),
-            ('TEXTCOLOR', (1, 1), (1, 1), colors.HexColor('#5b21b6')),
-            ('BACKGROUND', (2, 1), (2, 1), colors.HexColor('#fff7ed')),
-            ('TEXTCOLOR', (2, 1), (2, 1), colors.HexColor('#c2410c')),
-            ('BACKGROUND', (3, 1), (3, 1), colors.HexColor('#ccfbf1')),
-            ('TEXTCOLOR', (3, 1), (3, 1), colors.HexColor('#0f766e')),
-            ('BACKGROUND', (4, 1), (4, 1), colors.HexColor('#f1f5f9')),
-            ('TEXTCOLOR', (4, 1), (4, 1), colors.HexColor('#334155')),
-        ])
+        num_months = (end_date.year - start_date.year) * 12 + end_date.month - start_date.month + 1
+        if num_months > MAX_RANGE_MONTHS:
+            return jsonify({"error": f"Date range cannot span more than {MAX_RANGE_MONTHS} months"}), 400
         
-        legend_table.setStyle(legend_style)
-        elements.append(legend_table)
+        scheduler = DutyScheduler()
+        errors = []
+        months = scheduler.generate_schedule_range(employees_data, start_date, end_date, errors)
         
-        # Build PDF
-        doc.build(elements)
+        # Pull the first month before responding so invalid data is still a 400
+        first_month = next(months, None)
+        if first_month is None:
+            logger.error("Generated schedule is empty, likely due to data errors")
+            return jsonify({
+                "error": "Unable to generate schedule due to invalid employee data",
+                "errors": errors
+            }), 400
         
-        # Prepare for download
-        pdf_output.seek(0)
+        compact = bool(data.get('compact'))
         
-        end_time = datetime.now()
-        process_time = (end_time - start_time).total_seconds()
-        logger.info(f"PDF export completed in {process_time:.2f} seconds")
+        def month_line(schedule, **extra):
+            return dumps_json(dict({
+                'year': schedule.year,
+                'month': schedule.month,
+                'month_name': schedule.month_name,
+                'start_day': schedule.start_day,
+                'end_day': schedule.start_day + schedule.num_days - 1,
+                'schedule': schedule.to_dict(compact)
+            }, **extra)) + b'\n'
         
-        return send_file(
-            pdf_output,
-            mimetype='application/pdf',
-            as_attachment=True,
-            download_name=f'duty_schedule_{month_name}_{year}.pdf'
-        )
+        def stream():
+            # Rejected records are reported once, with the first month
+            yield month_line(first_month, errors=errors)
+            for schedule in months:
+                yield month_line(schedule)
         
+        logger.info(f"Streaming {num_months} months from {start_date} to {end_date}")
+        return Response(stream(), mimetype='application/x-ndjson')
     except Exception as e:
-        logger.error(f"Error exporting to PDF: {str(e)}")
+        logger.error(f"Error generating schedule range: {str(e)}", exc_info=True)
         return jsonify({"error": str(e)}), 500
 
-@app.errorhandler(404)
-def page_not_found(e):
-    return jsonify({"error": "Resource not found"}), 404
+def generate_group(employees_data, year, month):
+    """
+    Generate one batch group; runs in a pool process for large batches
+    
+    Returns:
+        A tuple of (schedule bytes, rejected employee records)
+    """
+    errors = []
+    schedule = DutyScheduler().generate_schedule(employees_data, year, month, errors)
+    return schedule.to_bytes(), errors
 
-@app.errorhandler(500)
-def internal_server_error(e):
-    return jsonify({"error": "Internal server error"}), 500
+class WorkerPool:
+    """
+    The process pool of a web worker, shared by batch generation and exports
+    
+    The pool is started on first use, so each gunicorn worker gets its own.
+    Pool processes come from a fork server (or are spawned where there is
+    none) rather than forked from a threaded web worker, which could copy a
+    lock held by another thread and deadlock. A pool broken by a dead process
+    is replaced on the next use.
+    """
+    
+    def __init__(self, max_workers):
+        self.max_workers = max_workers
+        self._pool = None
+        self._lock = threading.Lock()
+    
+    def _get_pool(self):
+        with self._lock:
+            if self._pool is None:
+                methods = multiprocessing.get_all_start_methods()
+                context = multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+                self._pool = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=context)
+            return self._pool
+    
+    def _discard(self, pool):
+        with self._lock:
+            if self._pool is pool:
+                self._pool = None
+    
+    def submit(self, function, *args):
+        """
+        Schedule one call and return its Future, restarting a broken pool once
+        """
+        pool = self._get_pool()
+        try:
+            return pool.submit(function, *args)
+        except BrokenProcessPool:
+            logger.warning("Process pool was broken, restarting it")
+            self._discard(pool)
+            return self._get_pool().submit(function, *args)
+    
+    def map(self, function, *iterables, chunksize=1):
+        """
+        Run a function over the iterables and return the results as a list
+        
+        Raises:
+            BrokenProcessPool: If a pool process died; the next call starts
+            a fresh pool
+        """
+        pool = self._get_pool()
+        try:
+            return list(pool.map(function, *iterables, chunksize=chunksize))
+        except BrokenProcessPool:
+            self._discard(pool)
+            raise
+
+worker_pool = WorkerPool(max(BATCH_WORKERS, EXPORT_JOB_WORKERS))
+
+def generate_groups(groups):
+    """
+    Generate the schedules of many groups, in parallel when the batch is big
+    
+    Generating a group costs microseconds per employee, so small batches are
+    cheaper to run here than to send to the pool.
+    
+    Args:
+        groups: List of (employees_data, year, month) tuples
+        
+    Returns:
+        A list of (Schedule, rejected employee records) tuples in the same order
+    """
+    total_employees = sum(len(employees_data) for employees_data, _, _ in groups)
+    
+    if total_employees >= BATCH_PARALLEL_MIN_EMPLOYEES and len(groups) > 1 and BATCH_WORKERS > 1:
+        employees, years, months = zip(*groups)
+        try:
+            results = worker_pool.map(
+                generate_group, employees, years, months,
+                chunksize=max(1, len(groups) // (BATCH_WORKERS * 4))
+            )
+            return [(Schedule.from_bytes(data), errors) for data, errors in results]
+        except BrokenProcessPool:
+            logger.warning("Process pool was broken, generating the batch in process")
+    
+    scheduler = DutyScheduler()
+    results = []
+    for employees_data, year, month in groups:
+        errors = []
+        results.append((scheduler.generate_schedule(employees_data, year, month, errors), errors))
+    return results
+
+def batch_group_title(group, index, year, month):
+    """
+    Name a batch group from its title, or its site, post and month
+    """
+    if group.get('title'):
+        return str(group['title'])
+    parts = [str(group[key]) for key in ('site', 'post') if group.get(key)]
+    if not parts:
+        parts = [f'Group {index + 1}']
+    parts.append(f'{calendar.month_abbr[month]} {year}')
+    return ' '.join(parts)
+
+@app.route('/generate_batch', methods=['POST'])
+def generate_batch():
+    """
+    Generate the schedules of many rosters in one request
+    
+    Takes a list of groups, each with its own employees and year/month and
+    optionally a site, post and title. A group's post is used for employees
+    that don't name one. Every group gets its own result, with a
+    schedule_id for the usual exports, and the batch as a whole gets a
+    batch_id for one combined workbook or PDF.
+    """
+    try:
+        start_time = time.perf_counter()
+        data = request.get_json()
+        
+        if not data:
+            logger.warning("No JSON data received for batch")
+            return jsonify({"error": "No data provided"}), 400
+        
+        groups = data.get('groups')
+        if not groups or not isinstance(groups, list):
+            return jsonify({"error": "No groups provided"}), 400
+        if len(groups) > MAX_BATCH_GROUPS:
+            return jsonify({"error": f"A batch cannot have more than {MAX_BATCH_GROUPS} groups"}), 400
+        
+        compact = bool(data.get('compact'))
+        include_schedules = data.get('include_schedules', True)
+        
+        results = [None] * len(groups)
+        pending = []
+        for index, group in enumerate(groups):
+            if not isinstance(group, dict):
+                results[index] = {'index': index, 'error': "Group must be an object"}
+                continue
+            try:
+                year = int(group.get('year', datetime.now().year))
+                month = int(group.get('month', datetime.now().month))
+                calendar.monthrange(year, month)
+            except (TypeError, ValueError) as e:
+                results[index] = {'index': index, 'error': f"Invalid year or month: {str(e)}"}
+                continue
+            
+            employees_data = group.get('employees')
+            if not employees_data or not isinstance(employees_data, list):
+                results[index] = {'index': index, 'error': "No employee data provided"}
+                continue
+            
+            post = group.get('post')
+            if post:
+                employees_data = [
+                    dict(emp, post=post) if isinstance(emp, dict) and 'post' not in emp else emp
+                    for emp in employees_data
+                ]
+            pending.append((index, batch_group_title(group, index, year, month), employees_data, year, month))
+        
+        generated = generate_groups([(employees_data, year, month) for _, _, employees_data, year, month in pending])
+        
+        manifest = []
+        for (index, title, _, year, month), (schedule, errors) in zip(pending, generated):
+            result = {
+                'index': index,
+                'title': title,
+                'site': groups[index].get('site'),
+                'post': groups[index].get('post'),
+                'year': year,
+                'month': month,
+                'month_name': calendar.month_name[month],
+                'errors': errors
+            }
+            if not schedule:
+                result['error'] = "Unable to generate schedule due to invalid employee data"
+            else:
+                result['schedule_id'] = schedule_store.put(schedule)
+                result['employees'] = len(schedule)
+                result['coverage'] = schedule.coverage()
+                if include_schedules:
+                    result['schedule'] = schedule.to_dict(compact)
+                manifest.append({'title': title, 'schedule_id': result['schedule_id']})
+            results[index] = result
+        
+        if not manifest:
+            logger.error("No group of the batch could be generated")
+            return json_response({
+                "error": "Unable to generate any schedule in the batch",
+                "groups": results
+            }, status=400)
+        
+        batch_id = schedule_store.put_batch(manifest)
+        process_time = time.perf_counter() - start_time
+        
+        log_event(
+            'generate_batch',
+            batch_id=batch_id,
+            groups=len(groups),
+            generated=len(manifest),
+            employees=sum(result.get('employees', 0) for result in results),
+            total_ms=round(process_time * 1000, 2)
+        )
+        
+        return json_response({
+            'batch_id': batch_id,
+            'groups': results,
+            'export_urls': {
+                'xlsx': url_for('export_batch_xlsx', batch_id=batch_id),
+                'pdf': url_for('export_batch_pdf', batch_id=batch_id)
+            },
+            'process_time': process_time
+        })
+    except Exception as e:
+        logger.error(f"Error generating batch: {str(e)}", exc_info=True)
+        return jsonify({"error": str(e)}), 500
+
+def build_excel(schedule, month_name, progress=None):
+    """
+    Render a schedule as an Excel workbook
+    
+    The sheet is written with openpyxl's write-only mode, so rows are streamed
+    to disk as they are appended and memory stays flat however many employees
+    there are.
+    
+    Args:
+        schedule: The Schedule to render
+        month_name: The month name shown in the title
+        progress: Optional function called with the fraction of rows written
+        
+    Returns:
+        A BytesIO positioned at the start of the xlsx file
+    """
+    load_export_backend('xlsx')
+    from openpyxl import Workbook
+    
+    # Create a BytesIO object to store the Excel file
+    output = BytesIO()
+    
+    wb = Workbook(write_only=True)
+    write_schedule_sheet(wb.create_sheet(), schedule, month_name, progress)
+    
+    # Save the Excel file
+    wb.save(output)
+    output.seek(0)
+    return output
+
+def build_excel_batch(groups, progress=None):
+    """
+    Render several schedules into one workbook, one sheet per schedule
+    
+    Args:
+        groups: List of (title, schedule, month_name) tuples; the title
+            names the sheet
+        progress: Optional function called with the fraction of sheets written
+        
+    Returns:
+        A BytesIO positioned at the start of the xlsx file
+    """
+    load_export_backend('xlsx')
+    from openpyxl import Workbook
+    
+    output = BytesIO()
+    wb = Workbook(write_only=True)
+    used_titles = set()
+    
+    for index, (title, schedule, month_name) in enumerate(groups):
+        write_schedule_sheet(wb.create_sheet(sheet_title(title, used_titles)), schedule, month_name)
+        if progress is not None:
+            progress((index + 1) / len(groups))
+    
+    wb.save(output)
+    output.seek(0)
+    return output
+
+def sheet_title(title, used_titles):
+    """
+    Make a title Excel accepts for a sheet: at most 31 characters, none of
+    []:*?/\\ and unique within the workbook
+    """
+    base = re.sub(r'[\[\]:*?/\\]', '-', str(title)).strip("' ")[:31] or 'Schedule'
+    candidate = base
+    number = 2
+    while candidate.lower() in used_titles:
+        suffix = f' ({number})'
+        candidate = base[:31 - len(suffix)] + suffix
+        number += 1
+    used_titles.add(candidate.lower())
+    return candidate
+
+def write_schedule_sheet(ws, schedule, month_name, progress=None):
+    """
+    Write one schedule to a write-only worksheet
+    
+    Every styled cell is built once and reused, because a row is serialised
+    as soon as it is appended.
+    
+    Args:
+        ws: The write-only worksheet
+        schedule: The Schedule to render
+        month_name: The month name shown in the title
+        progress: Optional function called with the fraction of rows written
+    """
+    from openpyxl.styles import PatternFill, Font, Alignment, Border, Side
+    from openpyxl.utils import get_column_letter
+    from openpyxl.cell import WriteOnlyCell
+    
+    year = schedule.year
+    month = schedule.month
+    
+    # Styles
+    header_fill = PatternFill(start_color="1e3a8a", end_color="1e3a8a", fill_type="solid")
+    subheader_fill = PatternFill(start_color="3b82f6", end_color="3b82f6", fill_type="solid")
+    header_font = Font(color="FFFFFF", bold=True, size=11)
+    title_font = Font(color="FFFFFF", bold=True, size=16)
+    border = Border(
+        left=Side(style='thin', color="000000"),
+        right=Side(style='thin', color="000000"),
+        top=Side(style='thin', color="000000"),
+        bottom=Side(style='thin', color="000000")
+    )
+    center_alignment = Alignment(horizontal='center', vertical='center')
+    
+    def title_cell(value):
+        cell = WriteOnlyCell(ws, value=value)
+        cell.font = title_font
+        cell.fill = header_fill
+        cell.alignment = center_alignment
+        return cell
+    
+    def header_cell(value=None):
+        cell = WriteOnlyCell(ws, value=value)
+        cell.font = header_font
+        cell.fill = subheader_fill
+        cell.alignment = center_alignment
+        cell.border = border
+        return cell
+    
+    def data_cell(value=None):
+        cell = WriteOnlyCell(ws, value=value)
+        cell.alignment = center_alignment
+        cell.border = border
+        return cell
+    
+    # Calculate last column letter
+    num_days = schedule.num_days
+    last_col = get_column_letter(num_days + 3)
+    
+    # Column widths have to be set before the first row is written
+    ws.column_dimensions['A'].width = 5  # S.R
+    ws.column_dimensions['B'].width = 20  # SUPERVISOR
+    ws.column_dimensions['C'].width = 10  # CODE NO.
+    
+    # Set fixed width for day columns
+    for day in range(1, num_days + 1):
+        col = get_column_letter(day + 3)
+        ws.column_dimensions[col].width = 5
+    
+    # Main Header
+    ws.merged_cells.add(f'A1:{last_col}1')
+    ws.append([title_cell('BAGASSE YARD SHIFT SCHEDULE')])
+    
+    ws.merged_cells.add(f'A2:{last_col}2')
+    ws.append([title_cell(f"{month_name.upper()} {year}")])
+    
+    # Column Headers and day headers (1, 2, 3...)
+    header_row = [header_cell('S.R'), header_cell('SUPERVISOR'), header_cell('CODE NO.')]
+    header_row.extend(header_cell(str(day)) for day in schedule.days)
+    ws.append(header_row)
+    
+    # Weekday names (MON, TUE...)
+    weekday_row = [header_cell(), header_cell(), header_cell()]
+    weekday_row.extend(
+        header_cell(DutyScheduler.get_day_name(int(year), int(month), day)[:3].upper())
+        for day in schedule.days
+    )
+    ws.append(weekday_row)
+    
+    # Fill data rows
+    sr_cell, name_cell, code_cell = data_cell(), data_cell(), data_cell()
+    shift_cells = {}
+    row_index = 5
+    sr_no = 1
+    
+    for name, code, post, shifts in schedule:
+        sr_cell.value = sr_no
+        name_cell.value = name
+        code_cell.value = code
+        
+        row = [sr_cell, name_cell, code_cell]
+        for shift in shifts:
+            cell = shift_cells.get(shift)
+            if cell is None:
+                cell = shift_cells[shift] = data_cell(shift)
+            row.append(cell)
+        ws.append(row)
+        
+        if progress is not None and sr_no % 500 == 0:
+            progress(sr_no / len(schedule))
+        
+        row_index += 1
+        sr_no += 1
+    
+    # Headcount on each working shift, one summary row per shift
+    coverage = schedule.coverage()
+    for shift in COVERAGE_SUMMARY_SHIFTS:
+        row = [header_cell(), header_cell(f'{shift} SHIFT TOTAL'), header_cell()]
+        row.extend(data_cell(count) for count in coverage[shift])
+        ws.append(row)
+        row_index += 1
+        
+    # Add legend for shift codes
+    legend_row = row_index + 2
+    for _ in range(row_index, legend_row):
+        ws.append([])
+    
+    legend_title = WriteOnlyCell(ws, value='Shift Legend:')
+    legend_title.font = Font(bold=True)
+    ws.append([legend_title])
+    
+    legend_items = [
+        ('A', 'Morning Shift (06:00-14:00)'),
+        ('B', 'Afternoon Shift (14:00-22:00)'),
+        ('C', 'Night Shift (22:00-06:00)'),
+        ('G', 'General Shift (09:00-17:00)'),
+        ('R', 'Rest Day')
+    ]
+    
+    for code, description in legend_items:
+        ws.append([f'{code} - {description}'])
+
+def schedule_from_payload(data):
+    """
+    Read the schedule posted back by the client for an export
+    
+    Returns:
+        A tuple of (schedule, month_name), or (None, None) if the payload is incomplete
+        
+    Raises:
+        ValueError: If the schedule rows are malformed
+    """
+    schedule = data.get('schedule', {})
+    month = data.get('month')
+    year = data.get('year')
+    month_name = data.get('month_name')
+    
+    if not schedule or not month or not year or not month_name:
+        return None, None
+    
+    return Schedule.from_dict(schedule, int(year), int(month)), month_name
+
+def send_artifact(schedule, month_name, extension, render, mimetype, variant=''):
+    """
+    Send a rendered export of one schedule as a download
+    
+    Rendered files are cached under a hash of the schedule, the title month
+    and the format.
+    
+    Args:
+        schedule: The Schedule to render
+        month_name: The month name shown in the title
+        extension: The file extension, which also identifies the format
+        render: Function taking (schedule, month_name) and returning a BytesIO
+        mimetype: The mimetype of the rendered file
+        variant: Name of the rendering options, part of the cache key
+    """
+    return send_rendered(
+        f'{schedule.content_hash()}:{month_name}:{extension}:{variant}',
+        f'duty_schedule_{month_name}_{schedule.year}.{extension}',
+        extension,
+        lambda: render(schedule, month_name),
+        mimetype,
+        f'{extension} export for {schedule.month}/{schedule.year} ({len(schedule)} employees)'
+    )
+
+def send_rendered(key, filename, extension, render, mimetype, description):
+    """
+    Send a rendered file as a download, rendering it only on a cache miss
+    
+    A hash of the cache key is the ETag, so a GET with a matching
+    If-None-Match gets a 304 without rendering anything.
+    
+    Args:
+        key: String identifying the content and format of the file
+        filename: The download file name
+        extension: The file extension, which also names the timing stage
+        render: Function taking no arguments and returning a BytesIO
+        mimetype: The mimetype of the rendered file
+        description: What is being exported, for the logs
+    """
+    etag = hashlib.sha256(f'{EXPORT_LAYOUT_VERSION}:{key}'.encode('utf-8')).hexdigest()[:32]
+    
+    if request.method in ('GET', 'HEAD') and etag in request.if_none_match:
+        logger.info(f"{description} not modified")
+        response = app.response_class(status=304)
+    else:
+        data = artifact_cache.get(etag)
+        if data is None:
+            start_time = time.perf_counter()
+            logger.info(f"Rendering {description}")
+            
+            data = render().getvalue()
+            artifact_cache.put(etag, data)
+            
+            process_time = time.perf_counter() - start_time
+            metrics.observe_stage(extension, process_time)
+            logger.info(f"{description} completed in {process_time:.2f} seconds")
+        else:
+            logger.info(f"{description} served from cache")
+        
+        response = send_file(
+            BytesIO(data),
+            mimetype=mimetype,
+            as_attachment=True,
+            download_name=filename
+        )
+    
+    response.set_etag(etag)
+    # Let browsers keep the file but check back with the ETag before reusing it
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+def send_excel(schedule, month_name):
+    """
+    Render a schedule as an Excel file and send it as a download
+    """
+    return send_artifact(
+        schedule, month_name, 'xlsx', build_excel,
+        'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+    )
+
+@app.route('/export', methods=['POST'])
+def export():
+    try:
+        data = request.get_json()
+        
+        if not data:
+            logger.warning("No JSON data received for export")
+            return jsonify({"error": "No data provided"}), 400
+        
+        try:
+            schedule, month_name = schedule_from_payload(data)
+        except ValueError as e:
+            logger.warning(f"Invalid schedule data received for export: {str(e)}")
+            return jsonify({"error": str(e)}), 400
+        
+        if schedule is None:
+            logger.warning("Incomplete schedule data received for export")
+            return jsonify({"error": "Incomplete schedule data provided"}), 400
+        
+        return send_excel(schedule, month_name)
+        
+    except Exception as e:
+        logger.error(f"Error exporting to Excel: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/export/<schedule_id>.xlsx')
+def export_stored(schedule_id):
+    """
+    Export a schedule kept by /generate as an Excel file
+    """
+    try:
+        schedule = schedule_store.get(schedule_id)
+        if schedule is None:
+            logger.warning(f"Schedule {schedule_id} not found for export")
+            return jsonify({"error": "Schedule not found"}), 404
+        
+        return send_excel(schedule, schedule.month_name)
+        
+    except Exception as e:
+        logger.error(f"Error exporting to Excel: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/debug_data', methods=['POST'])
+def debug_data():
+    """
+    Debug endpoint to check the structure of received employee data
+    """
+    try:
+        data = request.get_json()
+        if not data:
+            return jsonify({"error": "No data provided"}), 400
+            
+        employees_data = data.get('employees', [])
+        if not employees_data:
+            return jsonify({"error": "No employee data provided"}), 400
+        
+        result = {
+            'data_type': str(type(employees_data)),
+            'length': len(employees_data),
+            'first_item_type': str(type(employees_data[0])) if employees_data else None,
+            'first_item': employees_data[0] if employees_data else None,
+            'all_items': employees_data
+        }
+        
+        return jsonify(result)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+def load_export_backend(extension):
+    """
+    Import the modules an export format needs, timing the first import
+    
+    Args:
+        extension: The export format, 'xlsx' or 'pdf'
+    """
+    if extension in IMPORT_TIMES:
+        return
+    
+    start = time.perf_counter()
+    for module_name in EXPORT_BACKENDS[extension]:
+        importlib.import_module(module_name)
+    IMPORT_TIMES[extension] = time.perf_counter() - start
+    logger.info(f"Loaded {extension} export backend in {IMPORT_TIMES[extension] * 1000:.1f} ms")
+
+def preload_export_backends():
+    """
+    Import every export backend now instead of on first use
+    
+    Called from the gunicorn master when preloading, so forked workers share
+    the imported modules instead of each importing them again.
+    """
+    for extension in EXPORT_BACKENDS:
+        load_export_backend(extension)
+
+def import_report():
+    """
+    Report how long startup imports took, in milliseconds
+    
+    Returns:
+        A dictionary with the app module and every export backend loaded so far
+    """
+    return {name: round(seconds * 1000, 1) for name, seconds in IMPORT_TIMES.items()}
+
+@lru_cache(maxsize=None)
+def get_pdf_shift_colors():
+    """
+    Return the (background, text) reportlab colors for each shift, built once
+    """
+    load_export_backend('pdf')
+    from reportlab.lib import colors
+    
+    return {
+        shift: (colors.HexColor(f'#{background}'), colors.HexColor(f'#{text_color}'))
+        for shift, (background, text_color) in DutyScheduler().shift_badge_colors.items()
+    }
+
+def shift_style_blocks(rows, first_row, first_col):
+    """
+    Group equal shift cells into rectangles for table style commands
+    
+    Consecutive equal shifts in a row form a run, and a run is extended down
+    for as long as the following rows have the same run in the same columns.
+    Every cell belongs to exactly one block.
+    
+    Args:
+        rows: Iterable of shift strings, one per table row
+        first_row: The table row of the first shift string
+        first_col: The table column of the first day
+        
+    Yields:
+        (shift, (start_col, start_row), (end_col, end_row)) for each block
+    """
+    open_blocks = {}
+    row = first_row
+    for shifts in rows:
+        runs = {(match.start(), match.end() - 1, match.group(1)) for match in SHIFT_RUN_PATTERN.finditer(shifts)}
+        for run in [run for run in open_blocks if run not in runs]:
+            start, end, shift = run
+            yield shift, (first_col + start, open_blocks.pop(run)), (first_col + end, row - 1)
+        for run in runs:
+            open_blocks.setdefault(run, row)
+        row += 1
+    for (start, end, shift), start_row in open_blocks.items():
+        yield shift, (first_col + start, start_row), (first_col + end, row - 1)
+
+def build_pdf(schedule, month_name, group_by_post=False, progress=None):
+    """
+    Render a schedule as a PDF table with attractive styling
+    
+    Employees are split into page-sized tables that each carry the two header
+    rows, so reportlab never has to split one huge table and the work grows
+    linearly with the number of employees.
+    
+    Args:
+        schedule: The Schedule to render
+        month_name: The month name shown in the title
+        group_by_post: Start a new titled section for every post
+        progress: Optional function called with the fraction of pages laid out
+        
+    Returns:
+        A BytesIO positioned at the start of the PDF file
+    """
+    if group_by_post:
+        posts = OrderedDict()
+        for index, post in enumerate(schedule.posts):
+            posts.setdefault(post, []).append(index)
+        sections = [
+            (schedule, month_name, post, rows, schedule.coverage(post))
+            for post, rows in posts.items()
+        ]
+    else:
+        # Get the post name from the first employee (all employees will have same post)
+        sections = [
+            (schedule, month_name, schedule.posts[0], list(range(len(schedule))), schedule.coverage())
+        ]
+    return render_pdf_sections(sections, progress)
+
+def build_pdf_batch(groups, progress=None):
+    """
+    Render several schedules into one PDF, one titled section per schedule
+    
+    Args:
+        groups: List of (title, schedule, month_name) tuples
+        progress: Optional function called with the fraction of pages laid out
+        
+    Returns:
+        A BytesIO positioned at the start of the PDF file
+    """
+    sections = [
+        (schedule, month_name, title, list(range(len(schedule))), schedule.coverage())
+        for title, schedule, month_name in groups
+    ]
+    return render_pdf_sections(sections, progress)
+
+def render_pdf_sections(sections, progress=None):
+    """
+    Lay out schedule sections as page-sized tables, each section from a new page
+    
+    Args:
+        sections: List of (schedule, month_name, post_name, row indexes, coverage)
+            tuples, where coverage is the headcount matrix summarised under the
+            section
+        progress: Optional function called with the fraction of pages laid out
+        
+    Returns:
+        A BytesIO positioned at the start of the PDF file
+    """
+    load_export_backend('pdf')
+    from reportlab.lib import colors
+    from reportlab.lib.pagesizes import landscape, A4
+    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+    from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Spacer, PageBreak, Paragraph
+    
+    # Create a PDF file in memory
+    pdf_output = BytesIO()
+    
+    # Create the PDF document with adjusted margins
+    doc = SimpleDocTemplate(
+        pdf_output,
+        pagesize=landscape(A4),
+        rightMargin=10,
+        leftMargin=10,
+        topMargin=20,
+        bottomMargin=20
+    )
+    
+    # Get available page width and height
+    page_width = landscape(A4)[0] - doc.rightMargin - doc.leftMargin
+    page_height = landscape(A4)[1] - doc.topMargin - doc.bottomMargin
+    # SimpleDocTemplate's frame keeps 6 points of padding above and below
+    frame_height = page_height - 12
+    row_height = 20
+    
+    elements = []
+    
+    # Add attractive title
+    styles = getSampleStyleSheet()
+    title_style = ParagraphStyle(
+        'CustomTitle',
+        parent=styles['Title'],
+        fontSize=14,
+        spaceAfter=20,
+        alignment=1
+    )
+    
+    # Create post name cell with custom style
+    post_style = ParagraphStyle(
+        'PostStyle',
+        parent=styles['Normal'],
+        fontSize=10,  # Larger font size for post name
+        textColor=colors.white,
+        alignment=1,
+        fontName='Helvetica-Bold'
+    )
+    
+    # Style the table with attractive formatting
+    base_style = [
+        # Headers
+        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#1e3a8a')),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, 0), 7),
+        ('ALIGN', (0, 0), (-1, 0), 'CENTER'),
+        
+        # Day names row with darker background for post name
+        ('BACKGROUND', (0, 1), (-1, 1), colors.HexColor('#1e3a8a')),  # Darker blue background
+        ('TEXTCOLOR', (0, 1), (-1, 1), colors.white),
+        ('FONTNAME', (0, 1), (-1, 1), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 1), (-1, 1), 6),
+        ('ALIGN', (0, 1), (-1, 1), 'CENTER'),
+        
+        # Data rows
+        ('FONTNAME', (0, 2), (-1, -1), 'Helvetica'),
+        ('FONTSIZE', (0, 2), (-1, -1), 7),  # Slightly larger font for data
+        ('ALIGN', (0, 2), (-1, -1), 'CENTER'),  # Center all data
+        
+        # Grid styling
+        ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor('#cbd5e1')),  # Lighter grid color
+        ('LINEABOVE', (0, 0), (-1, 0), 1, colors.HexColor('#1e3a8a')),  # Thicker top border
+        ('LINEBELOW', (0, 1), (-1, 1), 1, colors.HexColor('#3b82f6')),  # Thicker header bottom border
+        
+        # Cell alignment and padding
+        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+        ('TOPPADDING', (0, 0), (-1, -1), 1),
+        ('BOTTOMPADDING', (0, 0), (-1, -1), 1),
+        ('LEFTPADDING', (0, 0), (-1, -1), 2),
+        ('RIGHTPADDING', (0, 0), (-1, -1), 2),
+    ]
+    zebra_colors = [colors.HexColor('#f8fafc'), colors.white]
+    shift_colors = get_pdf_shift_colors()
+    
+    # Calculate optimal column widths
+    name_col_width = page_width * 0.15  # 15% for name
+    sr_col_width = page_width * 0.04   # 4% for serial number
+    code_col_width = page_width * 0.04  # 4% for code
+    remaining_width = page_width - (name_col_width + sr_col_width + code_col_width)
+    
+    def page_table(schedule, headers, col_widths, rows, first_sr_no):
+        table_data = list(headers)
+        for sr_no, index in enumerate(rows, start=first_sr_no):
+            row = [sr_no, schedule.names[index], schedule.codes[index]]
+            row.extend(schedule.shifts(index))
+            table_data.append(row)
+        
+        # Create table with optimized settings
+        table = Table(table_data, colWidths=col_widths, rowHeights=[row_height]*len(table_data), repeatRows=2)
+        
+        table_style = TableStyle(base_style)
+        # Zebra striping for better readability, continued across pages
+        stripe = (first_sr_no - 1) % 2
+        table_style.add('ROWBACKGROUNDS', (0, 2), (-1, -1), zebra_colors[stripe:] + zebra_colors[:stripe])
+        
+        # Add shift-specific styles, one command per block of equal shifts
+        for shift, start, end in shift_style_blocks((schedule.shifts(index) for index in rows), 2, 3):
+            if shift in shift_colors:
+                background, text_color = shift_colors[shift]
+                table_style.add('BACKGROUND', start, end, background)
+                table_style.add('TEXTCOLOR', start, end, text_color)
+        table_style.add('FONTNAME', (3, 2), (-1, -1), 'Helvetica-Bold')
+        
+        table.setStyle(table_style)
+        return table
+    
+    def coverage_table(col_widths, coverage):
+        table_data = []
+        for shift in COVERAGE_SUMMARY_SHIFTS:
+            row = ['', f'{shift} SHIFT TOTAL', '']
+            row.extend(coverage[shift])
+            table_data.append(row)
+        
+        table = Table(table_data, colWidths=col_widths, rowHeights=[row_height]*len(table_data))
+        table.setStyle(TableStyle([
+            ('BACKGROUND', (0, 0), (2, -1), colors.HexColor('#e2e8f0')),
+            ('FONTNAME', (0, 0), (-1, -1), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, 0), (-1, -1), 7),
+            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+            ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor('#cbd5e1')),
+            ('LINEABOVE', (0, 0), (-1, 0), 1, colors.HexColor('#3b82f6')),
+            ('TOPPADDING', (0, 0), (-1, -1), 1),
+            ('BOTTOMPADDING', (0, 0), (-1, -1), 1),
+            ('LEFTPADDING', (0, 0), (-1, -1), 2),
+            ('RIGHTPADDING', (0, 0), (-1, -1), 2),
+        ]))
+        return table
+    
+    rows_per_page = int(frame_height // row_height) - 2
+    
+    for section_index, (schedule, month_name, post_name, rows, coverage) in enumerate(sections):
+        year = schedule.year
+        month = schedule.month
+        num_days = schedule.num_days
+        
+        if post_name is None:
+            post_name = 'SUPERVISOR'
+        if section_index:
+            elements.append(PageBreak())
+        
+        title = Paragraph(
+            f"<b>BAGASSE YARD SHIFT SCHEDULE - {post_name}</b><br/>{month_name.upper()} {year}",
+            title_style
+        )
+        elements.append(title)
+        post_cell = Paragraph(f"<b>{post_name}</b>", post_style)
+        
+        # Headers row
+        header_row = ['SR', 'NAME', 'CD']  # Shortened headers
+        header_row.extend([str(day) for day in schedule.days])
+        
+        # Day names row, with the post name under NAME
+        day_names = ['', post_cell, '']
+        day_names.extend([DutyScheduler.get_day_name(int(year), int(month), day)[:3]
+                         for day in schedule.days])
+        
+        day_width = remaining_width / num_days
+        col_widths = [sr_col_width, name_col_width, code_col_width]
+        col_widths.extend([day_width] * num_days)
+        
+        # The first page of a section loses the space taken by its title
+        title_height = title.wrap(page_width, page_height)[1] + title_style.spaceAfter
+        page_rows = max(1, int((frame_height - title_height) // row_height) - 2)
+        
+        start = 0
+        while start < len(rows):
+            elements.append(page_table(
+                schedule, (header_row, day_names), col_widths, rows[start:start + page_rows], start + 1
+            ))
+            start += page_rows
+            page_rows = rows_per_page
+        
+        # Headcount on each working shift under the section
+        elements.append(Spacer(1, 6))
+        elements.append(coverage_table(col_widths, coverage))
+    
+    # Add legend
+    elements.append(Spacer(1, 10))
+    
+    # Create legend table with simple text
+    legend_data = [
+        ['Shift Legend:', '', '', '', ''],
+        [
+            'A - Morning (06:00-14:00)',
+            'B - Afternoon (14:00-22:00)',
+            'C - Night (22:00-06:00)',
+            'G - General (09:00-17:00)',
+            'R - Rest Day'
+        ]
+    ]
+    
+    legend_table = Table(legend_data, colWidths=[page_width/5]*5, rowHeights=[12, 15])
+    
+    # Style the legend with colors directly in the table style
+    legend_style = TableStyle([
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+        ('FONTNAME', (0, 0), (-1, -1), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, -1), 8),
+    ])
+    # Add matching colors and backgrounds for each shift in the legend
+    for col, shift in enumerate('ABCGR'):
+        background, text_color = shift_colors[shift]
+        legend_style.add('BACKGROUND', (col, 1), (col, 1), background)
+        legend_style.add('TEXTCOLOR', (col, 1), (col, 1), text_color)
+    
+    legend_table.setStyle(legend_style)
+    elements.append(legend_table)
+    
+    if progress is not None:
+        num_elements = len(elements)
+        
+        def on_progress(kind, value):
+            if kind == 'PROGRESS':
+                progress(value / num_elements)
+        
+        doc.setProgressCallBack(on_progress)
+    
+    # Build PDF
+    doc.build(elements)
+    
+    # Prepare for download
+    pdf_output.seek(0)
+    return pdf_output
+
+def send_pdf(schedule, month_name, group_by_post=False):
+    """
+    Render a schedule as a PDF file and send it as a download
+    """
+    render = partial(build_pdf, group_by_post=group_by_post)
+    variant = 'by-post' if group_by_post else ''
+    return send_artifact(schedule, month_name, 'pdf', render, 'application/pdf', variant)
+
+@app.route('/export_pdf', methods=['POST'])
+def export_pdf():
+    """
+    Export the schedule as a PDF file with attractive styling
+    """
+    try:
+        data = request.get_json()
+        
+        if not data:
+            logger.warning("No JSON data received for PDF export")
+            return jsonify({"error": "No data provided"}), 400
+        
+        try:
+            schedule, month_name = schedule_from_payload(data)
+        except ValueError as e:
+            logger.warning(f"Invalid schedule data received for PDF export: {str(e)}")
+            return jsonify({"error": str(e)}), 400
+        
+        if schedule is None:
+            logger.warning("Incomplete schedule data received for PDF export")
+            return jsonify({"error": "Incomplete schedule data provided"}), 400
+        
+        return send_pdf(schedule, month_name, bool(data.get('group_by_post')))
+        
+    except Exception as e:
+        logger.error(f"Error exporting to PDF: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/export/<schedule_id>.pdf')
+def export_pdf_stored(schedule_id):
+    """
+    Export a schedule kept by /generate as a PDF file
+    """
+    try:
+        schedule = schedule_store.get(schedule_id)
+        if schedule is None:
+            logger.warning(f"Schedule {schedule_id} not found for PDF export")
+            return jsonify({"error": "Schedule not found"}), 404
+        
+        group_by_post = request.args.get('group_by_post', '0').lower() in ('1', 'true')
+        return send_pdf(schedule, schedule.month_name, group_by_post)
+        
+    except Exception as e:
+        logger.error(f"Error exporting to PDF: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+@lru_cache(maxsize=None)
+def shift_intervals():
+    """
+    Return the start and length of every timed shift in DutyScheduler.shifts
+    
+    A shift that ends at or before its start time, like C (22:00-06:00),
+    ends on the next day.
+    
+    Returns:
+        A dictionary mapping each shift code to a pair of timedeltas: the
+        start after midnight and the length
+    """
+    intervals = {}
+    for shift, hours in DutyScheduler().shifts.items():
+        match = re.fullmatch(r'(\d{2}):(\d{2})-(\d{2}):(\d{2})', hours)
+        if match is None:
+            continue
+        start_hour, start_minute, end_hour, end_minute = (int(part) for part in match.groups())
+        duration = timedelta(hours=end_hour - start_hour, minutes=end_minute - start_minute)
+        if duration <= timedelta(0):
+            duration += timedelta(days=1)
+        intervals[shift] = (timedelta(hours=start_hour, minutes=start_minute), duration)
+    return intervals
+
+def ics_escape(text):
+    """Escape a TEXT property value (RFC 5545, 3.3.11)"""
+    return (str(text).replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,')
+            .replace('\r\n', '\\n').replace('\n', '\\n'))
+
+def fold_ics_line(line):
+    """
+    Fold a content line into CRLF-terminated lines of at most 75 octets
+    
+    Continuation lines start with a space, and multi-byte UTF-8 characters
+    are never split.
+    """
+    data = line.encode('utf-8')
+    if len(data) <= 75:
+        return data + b'\r\n'
+    parts = []
+    start = 0
+    limit = 75
+    while len(data) - start > limit:
+        end = start + limit
+        # Step back to the start of a character
+        while data[end] & 0xC0 == 0x80:
+            end -= 1
+        parts.append(data[start:end])
+        start = end
+        # Continuation lines lose one octet to the leading space
+        limit = 74
+    parts.append(data[start:])
+    return b'\r\n '.join(parts) + b'\r\n'
+
+def build_ics(schedule, index, schedule_id, stamp):
+    """
+    Render one employee's shifts as an iCalendar file
+    
+    Every run of consecutive days on the same shift is one event repeated
+    daily with RRULE COUNT, so a month is a handful of events rather than
+    one per day. Rest days have no events. Times are floating local times.
+    
+    Args:
+        schedule: The Schedule
+        index: The employee's row in the schedule
+        schedule_id: The schedule ID, part of every event UID
+        stamp: The DTSTAMP value, a UTC time as YYYYMMDDTHHMMSSZ
+        
+    Returns:
+        The .ics file as bytes
+    """
+    name, code, post = schedule.names[index], schedule.codes[index], schedule.posts[index]
+    intervals = shift_intervals()
+    shift_hours = DutyScheduler().shifts
+    lines = [
+        'BEGIN:VCALENDAR',
+        'VERSION:2.0',
+        'PRODID:-//Bagasse Yard//Duty Scheduler//EN',
+        'CALSCALE:GREGORIAN',
+        'METHOD:PUBLISH',
+        f'X-WR-CALNAME:{ics_escape(f"Duty schedule - {name}")}'
+    ]
+    first_day = date(schedule.year, schedule.month, schedule.start_day)
+    for run in SHIFT_RUN_PATTERN.finditer(schedule.shifts(index)):
+        shift = run.group(1)
+        interval = intervals.get(shift)
+        if interval is None:
+            continue
+        start_offset, duration = interval
+        day = first_day + timedelta(days=run.start())
+        start = datetime(day.year, day.month, day.day) + start_offset
+        end = start + duration
+        lines.extend([
+            'BEGIN:VEVENT',
+            f'UID:{schedule_id}-{index}-{run.start()}@duty-scheduler',
+            f'DTSTAMP:{stamp}',
+            f'DTSTART:{start:%Y%m%dT%H%M%S}',
+            f'DTEND:{end:%Y%m%dT%H%M%S}',
+        ])
+        count = run.end() - run.start()
+        if count > 1:
+            lines.append(f'RRULE:FREQ=DAILY;COUNT={count}')
+        lines.extend([
+            f'SUMMARY:{ics_escape(f"{shift} shift ({shift_hours[shift]})")}',
+            f'DESCRIPTION:{ics_escape(f"{name} ({code}), {post}")}',
+            'TRANSP:OPAQUE',
+            'END:VEVENT'
+        ])
+    lines.append('END:VCALENDAR')
+    return b''.join(fold_ics_line(line) for line in lines)
+
+def ics_stamp():
+    return datetime.utcnow().strftime('%Y%m%dT%H%M%SZ')
+
+def ics_filename(name, sr_no):
+    """A zip-safe file name for one employee's calendar"""
+    ascii_name = unicodedata.normalize('NFKD', str(name)).encode('ascii', 'ignore').decode('ascii')
+    safe_name = re.sub(r'[^A-Za-z0-9._-]+', '_', ascii_name).strip('._') or 'employee'
+    return f'{sr_no:05d}_{safe_name[:60]}.ics'
+
+class ZipStream:
+    """
+    Write-only file object that hands the bytes written to it to a generator
+    
+    zipfile writes to it as to an unseekable file, so a zip archive can be
+    sent while it is being built.
+    """
+    
+    def __init__(self):
+        self.chunks = []
+    
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+    
+    def flush(self):
+        pass
+    
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+def ics_zip_stream(schedule, schedule_id):
+    """
+    Yield a zip archive of every employee's calendar, one file at a time
+    
+    Only one calendar and its compressed bytes are held in memory at once.
+    """
+    stream = ZipStream()
+    stamp = ics_stamp()
+    date_time = datetime.utcnow().timetuple()[:6]
+    with zipfile.ZipFile(stream, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for index in range(len(schedule)):
+            info = zipfile.ZipInfo(ics_filename(schedule.names[index], index + 1), date_time)
+            info.compress_type = zipfile.ZIP_DEFLATED
+            archive.writestr(info, build_ics(schedule, index, schedule_id, stamp))
+            data = stream.drain()
+            if data:
+                yield data
+    yield stream.drain()
+
+@app.route('/export/<schedule_id>.ics')
+def export_ics(schedule_id):
+    """
+    Export one employee's shifts as an iCalendar file, e.g. /export/<id>.ics?name=Alice
+    """
+    try:
+        schedule = schedule_store.get(schedule_id)
+        if schedule is None:
+            logger.warning(f"Schedule {schedule_id} not found for calendar export")
+            return jsonify({"error": "Schedule not found"}), 404
+        
+        name = request.args.get('name')
+        if not name:
+            return jsonify({"error": "name is required"}), 400
+        try:
+            index = schedule.index(name)
+        except KeyError:
+            return jsonify({"error": f"{name} is not in the schedule"}), 404
+        
+        return send_file(
+            BytesIO(build_ics(schedule, index, schedule_id, ics_stamp())),
+            mimetype='text/calendar',
+            as_attachment=True,
+            download_name=ics_filename(name, index + 1)
+        )
+    except Exception as e:
+        logger.error(f"Error exporting calendar: {str(e)}", exc_info=True)
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/export/<schedule_id>.zip')
+def export_ics_zip(schedule_id):
+    """
+    Export every employee's calendar as one zip file, streamed as it is built
+    """
+    try:
+        schedule = schedule_store.get(schedule_id)
+        if schedule is None:
+            logger.warning(f"Schedule {schedule_id} not found for calendar export")
+            return jsonify({"error": "Schedule not found"}), 404
+        
+        logger.info(f"Streaming {len(schedule)} calendars for schedule {schedule_id}")
+        response = Response(ics_zip_stream(schedule, schedule_id), mimetype='application/zip')
+        response.headers['Content-Disposition'] = (
+            f'attachment; filename=duty_calendars_{schedule.month_name}_{schedule.year}.zip'
+        )
+        return response
+    except Exception as e:
+        logger.error(f"Error exporting calendars: {str(e)}", exc_info=True)
+        return jsonify({"error": str(e)}), 500
+
+def schedule_csv_chunks(schedule):
+    """
+    Yield a schedule as CSV: name, code, post, then one column per date
+    
+    Rows are encoded STREAM_CHUNK_EMPLOYEES at a time, so nothing but the
+    current chunk is held in memory.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\r\n')
+    writer.writerow(['name', 'code', 'post'] + [
+        f'{schedule.year}-{schedule.month:02d}-{day:02d}' for day in schedule.days
+    ])
+    for count, (name, code, post, shifts) in enumerate(schedule, start=1):
+        writer.writerow([name, code, post] + list(shifts))
+        if count % STREAM_CHUNK_EMPLOYEES == 0:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode('utf-8')
+
+@app.route('/export/<schedule_id>.csv')
+def export_csv(schedule_id):
+    """
+    Stream a stored schedule as CSV, for machine consumers
+    """
+    try:
+        schedule = schedule_store.get(schedule_id)
+        if schedule is None:
+            logger.warning(f"Schedule {schedule_id} not found for CSV export")
+            return jsonify({"error": "Schedule not found"}), 404
+        
+        response = Response(schedule_csv_chunks(schedule), mimetype='text/csv')
+        response.headers['Content-Disposition'] = (
+            f'attachment; filename=duty_schedule_{schedule.month_name}_{schedule.year}.csv'
+        )
+        return response
+    except Exception as e:
+        logger.error(f"Error exporting to CSV: {str(e)}", exc_info=True)
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/export/<schedule_id>.ndjson')
+def export_ndjson(schedule_id):
+    """
+    Stream a stored schedule as NDJSON: a header line, then one line per employee
+    
+    Each employee's shifts are one string, as with compact /generate responses.
+    """
+    try:
+        schedule = schedule_store.get(schedule_id)
+        if schedule is None:
+            logger.warning(f"Schedule {schedule_id} not found for NDJSON export")
+            return jsonify({"error": "Schedule not found"}), 404
+        
+        header = {
+            'schedule_id': schedule_id,
+            'year': schedule.year,
+            'month': schedule.month,
+            'month_name': schedule.month_name,
+            'start_day': schedule.start_day,
+            'num_days': schedule.num_days,
+            'employees': len(schedule)
+        }
+        response = Response(schedule_lines(header, schedule, compact=True), mimetype='application/x-ndjson')
+        response.headers['Content-Disposition'] = (
+            f'attachment; filename=duty_schedule_{schedule.month_name}_{schedule.year}.ndjson'
+        )
+        return response
+    except Exception as e:
+        logger.error(f"Error exporting to NDJSON: {str(e)}", exc_info=True)
+        return jsonify({"error": str(e)}), 500
+
+# Renderer and mimetype for each export format
+EXPORT_FORMATS = {
+    'xlsx': (build_excel, 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'),
+    'pdf': (build_pdf, 'application/pdf')
+}
+
+def load_batch(batch_id):
+    """
+    Load the schedules of a stored batch
+    
+    Returns:
+        A list of (title, schedule, month_name) tuples, or None if the batch
+        or any of its schedules is no longer stored
+    """
+    manifest = schedule_store.get_batch(batch_id)
+    if manifest is None:
+        return None
+    groups = []
+    for entry in manifest:
+        schedule = schedule_store.get(entry['schedule_id'])
+        if schedule is None:
+            return None
+        groups.append((entry['title'], schedule, schedule.month_name))
+    return groups
+
+@app.route('/export/batch/<batch_id>.xlsx')
+def export_batch_xlsx(batch_id):
+    """
+    Export every schedule of a batch as one workbook, one sheet per group
+    """
+    try:
+        groups = load_batch(batch_id)
+        if groups is None:
+            return jsonify({"error": "Batch not found"}), 404
+        return send_rendered(
+            f'batch:{batch_id}:xlsx',
+            f'duty_schedule_batch_{batch_id[:8]}.xlsx',
+            'xlsx',
+            lambda: build_excel_batch(groups),
+            EXPORT_FORMATS['xlsx'][1],
+            f"xlsx export of batch {batch_id} ({len(groups)} groups)"
+        )
+    except Exception as e:
+        logger.error(f"Error exporting batch to Excel: {str(e)}", exc_info=True)
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/export/batch/<batch_id>.pdf')
+def export_batch_pdf(batch_id):
+    """
+    Export every schedule of a batch as one PDF, one section per group
+    """
+    try:
+        groups = load_batch(batch_id)
+        if groups is None:
+            return jsonify({"error": "Batch not found"}), 404
+        return send_rendered(
+            f'batch:{batch_id}:pdf',
+            f'duty_schedule_batch_{batch_id[:8]}.pdf',
+            'pdf',
+            lambda: build_pdf_batch(groups),
+            EXPORT_FORMATS['pdf'][1],
+            f"pdf export of batch {batch_id} ({len(groups)} groups)"
+        )
+    except Exception as e:
+        logger.error(f"Error exporting batch to PDF: {str(e)}", exc_info=True)
+        return jsonify({"error": str(e)}), 500
+
+def diff_schedules(old, new):
+    """
+    Compare two schedules cell by cell, matching employees by name
+    
+    Days are matched by day of the month, so two months or two generations
+    of one month can be compared. Rows are compared as raw bytes first and
+    only rows that differ are walked day by day.
+    
+    Args:
+        old: The earlier Schedule
+        new: The later Schedule
+        
+    Returns:
+        A dictionary with the compared days, the changed cells as
+        (name, day, old shift, new shift) tuples, where a shift is None on a
+        day one schedule does not cover, the added and removed names, and
+        the number of unchanged employees
+    """
+    days = sorted(set(old.days) | set(new.days))
+    same_shape = old.start_day == new.start_day and old.num_days == new.num_days
+    old_cells, new_cells = old.cells, new.cells
+    changes = []
+    removed = []
+    unchanged = 0
+    
+    for old_index, name in enumerate(old.names):
+        new_index = new._index.get(name)
+        if new_index is None:
+            removed.append(name)
+            continue
+        old_row = old_cells[old_index * old.num_days:(old_index + 1) * old.num_days]
+        new_row = new_cells[new_index * new.num_days:(new_index + 1) * new.num_days]
+        if same_shape and old_row == new_row:
+            unchanged += 1
+            continue
+        
+        row_changes = []
+        for day in days:
+            before = old_row[day - old.start_day] if 0 <= day - old.start_day < old.num_days else None
+            after = new_row[day - new.start_day] if 0 <= day - new.start_day < new.num_days else None
+            if before != after:
+                row_changes.append((
+                    name, day,
+                    None if before is None else chr(before),
+                    None if after is None else chr(after)
+                ))
+        if row_changes:
+            changes.extend(row_changes)
+        else:
+            unchanged += 1
+    
+    added = [name for name in new.names if name not in old._index]
+    return {
+        'days': days,
+        'changes': changes,
+        'added': added,
+        'removed': removed,
+        'unchanged': unchanged
+    }
+
+def diff_rows(old, new, diff):
+    """
+    Lay out the employees of a diff for the exports
+    
+    Yields:
+        (name, code, status, cells) tuples for every added, removed or changed
+        employee, where status is 'added', 'removed' or 'changed' and cells
+        has one (text, changed) pair per compared day
+    """
+    changed = OrderedDict()
+    for name, day, before, after in diff['changes']:
+        changed.setdefault(name, {})[day] = (before, after)
+    
+    def cells_of(schedule, index):
+        for day in diff['days']:
+            if 0 <= day - schedule.start_day < schedule.num_days:
+                yield chr(schedule.cells[index * schedule.num_days + day - schedule.start_day]), True
+            else:
+                yield '', False
+    
+    for name, days in changed.items():
+        index = new.index(name)
+        cells = []
+        for day in diff['days']:
+            if day in days:
+                before, after = days[day]
+                cells.append((f"{before or '-'}>{after or '-'}", True))
+            else:
+                cells.append((chr(new.cells[index * new.num_days + day - new.start_day]), False))
+        yield name, new.codes[index], 'changed', cells
+    for name in diff['added']:
+        index = new.index(name)
+        yield name, new.codes[index], 'added', list(cells_of(new, index))
+    for name in diff['removed']:
+        index = old.index(name)
+        yield name, old.codes[index], 'removed', list(cells_of(old, index))
+
+def diff_title(old, new):
+    return f"SCHEDULE CHANGES: {old.month_name.upper()} {old.year} TO {new.month_name.upper()} {new.year}"
+
+def build_diff_excel(old, new, diff):
+    """
+    Render the differences between two schedules as an Excel workbook
+    
+    Only employees with a change are listed. Changed cells read "old>new"
+    and are highlighted; added employees are green and removed ones red.
+    
+    Returns:
+        A BytesIO positioned at the start of the xlsx file
+    """
+    load_export_backend('xlsx')
+    from openpyxl import Workbook
+    from openpyxl.styles import PatternFill, Font, Alignment, Border, Side
+    from openpyxl.utils import get_column_letter
+    from openpyxl.cell import WriteOnlyCell
+    
+    output = BytesIO()
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet('Changes')
+    
+    thin = Side(style='thin', color="000000")
+    border = Border(left=thin, right=thin, top=thin, bottom=thin)
+    center_alignment = Alignment(horizontal='center', vertical='center')
+    header_fill = PatternFill(start_color="1e3a8a", end_color="1e3a8a", fill_type="solid")
+    status_fills = {
+        'changed': PatternFill(start_color="fde68a", end_color="fde68a", fill_type="solid"),
+        'added': PatternFill(start_color="bbf7d0", end_color="bbf7d0", fill_type="solid"),
+        'removed': PatternFill(start_color="fecaca", end_color="fecaca", fill_type="solid")
+    }
+    
+    def cell(value=None, fill=None, font=None):
+        result = WriteOnlyCell(ws, value=value)
+        result.alignment = center_alignment
+        result.border = border
+        if fill is not None:
+            result.fill = fill
+        if font is not None:
+            result.font = font
+        return result
+    
+    days = diff['days']
+    ws.column_dimensions['A'].width = 20
+    ws.column_dimensions['B'].width = 10
+    ws.column_dimensions['C'].width = 10
+    for column in range(4, len(days) + 4):
+        ws.column_dimensions[get_column_letter(column)].width = 6
+    
+    last_col = get_column_letter(len(days) + 3)
+    ws.merged_cells.add(f'A1:{last_col}1')
+    title = WriteOnlyCell(ws, value=diff_title(old, new))
+    title.font = Font(color="FFFFFF", bold=True, size=14)
+    title.fill = header_fill
+    title.alignment = center_alignment
+    ws.append([title])
+    
+    header_font = Font(color="FFFFFF", bold=True)
+    header = [cell(text, header_fill, header_font) for text in ('NAME', 'CODE NO.', 'STATUS')]
+    header.extend(cell(str(day), header_fill, header_font) for day in days)
+    ws.append(header)
+    
+    bold = Font(bold=True)
+    plain = {}
+    for name, code, status, cells in diff_rows(old, new, diff):
+        fill = status_fills[status]
+        row = [cell(name, fill), cell(code, fill), cell(status.upper(), fill)]
+        for text, changed in cells:
+            if status != 'changed':
+                row.append(cell(text, fill))
+            elif changed:
+                row.append(cell(text, fill, bold))
+            else:
+                # Unchanged cells are shared, as in write_schedule_sheet
+                shared = plain.get(text)
+                if shared is None:
+                    shared = plain[text] = cell(text)
+                row.append(shared)
+        ws.append(row)
+    
+    ws.append([])
+    ws.append([f"{len(diff['changes'])} changed cells, {len(diff['added'])} added, "
+               f"{len(diff['removed'])} removed, {diff['unchanged']} unchanged employees"])
+    
+    wb.save(output)
+    output.seek(0)
+    return output
+
+def build_diff_pdf(old, new, diff):
+    """
+    Render the differences between two schedules as a PDF table
+    
+    Uses the same layout and highlighting as build_diff_excel.
+    
+    Returns:
+        A BytesIO positioned at the start of the PDF file
+    """
+    load_export_backend('pdf')
+    from reportlab.lib import colors
+    from reportlab.lib.pagesizes import landscape, A4
+    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+    from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Spacer, Paragraph
+    
+    pdf_output = BytesIO()
+    doc = SimpleDocTemplate(
+        pdf_output,
+        pagesize=landscape(A4),
+        rightMargin=10,
+        leftMargin=10,
+        topMargin=20,
+        bottomMargin=20
+    )
+    page_width = landscape(A4)[0] - doc.rightMargin - doc.leftMargin
+    
+    styles = getSampleStyleSheet()
+    title_style = ParagraphStyle('DiffTitle', parent=styles['Title'], fontSize=14, spaceAfter=20, alignment=1)
+    elements = [Paragraph(f"<b>{diff_title(old, new)}</b>", title_style)]
+    
+    days = diff['days']
+    name_col_width = page_width * 0.15
+    code_col_width = page_width * 0.05
+    status_col_width = page_width * 0.06
+    day_width = (page_width - name_col_width - code_col_width - status_col_width) / len(days)
+    col_widths = [name_col_width, code_col_width, status_col_width] + [day_width] * len(days)
+    
+    status_colors = {
+        'changed': colors.HexColor('#fde68a'),
+        'added': colors.HexColor('#bbf7d0'),
+        'removed': colors.HexColor('#fecaca')
+    }
+    table_data = [['NAME', 'CD', 'STATUS'] + [str(day) for day in days]]
+    table_style = TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#1e3a8a')),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
+        ('FONTSIZE', (0, 0), (-1, -1), 6),
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+        ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor('#cbd5e1')),
+        ('TOPPADDING', (0, 0), (-1, -1), 1),
+        ('BOTTOMPADDING', (0, 0), (-1, -1), 1),
+        ('LEFTPADDING', (0, 0), (-1, -1), 1),
+        ('RIGHTPADDING', (0, 0), (-1, -1), 1),
+    ])
+    
+    for row_index, (name, code, status, cells) in enumerate(diff_rows(old, new, diff), start=1):
+        table_data.append([name, code, status.upper()] + [text for text, _ in cells])
+        color = status_colors[status]
+        if status == 'changed':
+            table_style.add('BACKGROUND', (0, row_index), (2, row_index), color)
+            for col, (_, changed) in enumerate(cells, start=3):
+                if changed:
+                    table_style.add('BACKGROUND', (col, row_index), (col, row_index), color)
+                    table_style.add('FONTNAME', (col, row_index), (col, row_index), 'Helvetica-Bold')
+        else:
+            table_style.add('BACKGROUND', (0, row_index), (-1, row_index), color)
+    
+    if len(table_data) > 1:
+        table = Table(table_data, colWidths=col_widths, rowHeights=16, repeatRows=1)
+        table.setStyle(table_style)
+        elements.append(table)
+    
+    elements.append(Spacer(1, 10))
+    elements.append(Paragraph(
+        f"{len(diff['changes'])} changed cells, {len(diff['added'])} added, "
+        f"{len(diff['removed'])} removed, {diff['unchanged']} unchanged employees",
+        styles['Normal']
+    ))
+    
+    doc.build(elements)
+    pdf_output.seek(0)
+    return pdf_output
+
+def load_diff(old_id, new_id):
+    """
+    Load the two schedules of a diff, or return an error response for the first one missing
+    """
+    old = schedule_store.get(old_id)
+    if old is None:
+        return None, None, (jsonify({"error": f"Schedule {old_id} not found"}), 404)
+    new = schedule_store.get(new_id)
+    if new is None:
+        return None, None, (jsonify({"error": f"Schedule {new_id} not found"}), 404)
+    return old, new, None
+
+@app.route('/diff/<old_id>/<new_id>')
+def diff(old_id, new_id):
+    """
+    Changed cells between two stored schedules
+    
+    Each change is [name, day, old shift, new shift]; employees only in one
+    schedule are listed as added or removed instead.
+    """
+    try:
+        start_time = time.perf_counter()
+        old, new, error = load_diff(old_id, new_id)
+        if error is not None:
+            return error
+        
+        result = diff_schedules(old, new)
+        process_time = time.perf_counter() - start_time
+        logger.info(f"Diff of {old_id} and {new_id}: {len(result['changes'])} changed cells "
+                    f"in {process_time:.3f} seconds")
+        return json_response({
+            'old_schedule_id': old_id,
+            'new_schedule_id': new_id,
+            'old': {'year': old.year, 'month': old.month, 'month_name': old.month_name},
+            'new': {'year': new.year, 'month': new.month, 'month_name': new.month_name},
+            'changes': result['changes'],
+            'added': result['added'],
+            'removed': result['removed'],
+            'changed_cells': len(result['changes']),
+            'changed_employees': len({change[0] for change in result['changes']}),
+            'unchanged_employees': result['unchanged'],
+            'export_urls': {
+                'xlsx': url_for('diff_xlsx', old_id=old_id, new_id=new_id),
+                'pdf': url_for('diff_pdf', old_id=old_id, new_id=new_id)
+            },
+            'process_time': process_time
+        })
+    except Exception as e:
+        logger.error(f"Error comparing schedules: {str(e)}", exc_info=True)
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/diff/<old_id>/<new_id>.xlsx')
+def diff_xlsx(old_id, new_id):
+    """
+    Export the differences between two stored schedules as an Excel file
+    """
+    try:
+        old, new, error = load_diff(old_id, new_id)
+        if error is not None:
+            return error
+        return send_rendered(
+            f'diff:{old_id}:{new_id}:xlsx',
+            f'schedule_changes_{old_id[:8]}_{new_id[:8]}.xlsx',
+            'xlsx',
+            lambda: build_diff_excel(old, new, diff_schedules(old, new)),
+            EXPORT_FORMATS['xlsx'][1],
+            f"xlsx diff of {old_id} and {new_id}"
+        )
+    except Exception as e:
+        logger.error(f"Error exporting schedule diff to Excel: {str(e)}", exc_info=True)
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/diff/<old_id>/<new_id>.pdf')
+def diff_pdf(old_id, new_id):
+    """
+    Export the differences between two stored schedules as a PDF file
+    """
+    try:
+        old, new, error = load_diff(old_id, new_id)
+        if error is not None:
+            return error
+        return send_rendered(
+            f'diff:{old_id}:{new_id}:pdf',
+            f'schedule_changes_{old_id[:8]}_{new_id[:8]}.pdf',
+            'pdf',
+            lambda: build_diff_pdf(old, new, diff_schedules(old, new)),
+            EXPORT_FORMATS['pdf'][1],
+            f"pdf diff of {old_id} and {new_id}"
+        )
+    except Exception as e:
+        logger.error(f"Error exporting schedule diff to PDF: {str(e)}", exc_info=True)
+        return jsonify({"error": str(e)}), 500
+
+def write_job_status(directory, status):
+    """
+    Atomically replace the status file of an export job
+    """
+    path = os.path.join(directory, f"{status['job_id']}.json")
+    temp_path = f'{path}.{os.getpid()}.tmp'
+    with open(temp_path, 'w') as f:
+        json.dump(status, f)
+    os.replace(temp_path, path)
+
+def run_export_job(directory, status, schedule_data, month_name, group_by_post=False):
+    """
+    Render one export job inside a pool process
+    
+    Progress and the final state are written to the job's status file, which
+    is what every web worker reads when the job is polled.
+    """
+    job_id = status['job_id']
+    extension = status['format']
+    last_write = [0.0]
+    
+    def progress(fraction):
+        now = time.monotonic()
+        # Status updates are throttled so big exports don't spend time on them
+        if now - last_write[0] >= 0.5:
+            status['progress'] = round(min(fraction, 0.99), 2)
+            write_job_status(directory, status)
+            last_write[0] = now
+    
+    try:
+        status['status'] = 'running'
+        write_job_status(directory, status)
+        
+        schedule = Schedule.from_bytes(schedule_data)
+        if extension == 'pdf':
+            output = build_pdf(schedule, month_name, group_by_post=group_by_post, progress=progress)
+        else:
+            output = EXPORT_FORMATS[extension][0](schedule, month_name, progress=progress)
+        
+        path = os.path.join(directory, f'{job_id}.{extension}')
+        with open(f'{path}.tmp', 'wb') as f:
+            f.write(output.getbuffer())
+        os.replace(f'{path}.tmp', path)
+        
+        status['status'] = 'done'
+        status['progress'] = 1.0
+    except Exception as e:
+        logger.error(f"Export job {job_id} failed: {str(e)}", exc_info=True)
+        status['status'] = 'failed'
+        status['error'] = str(e)
+    
+    status['finished'] = time.time()
+    write_job_status(directory, status)
+
+class ExportJobQueue:
+    """
+    Runs heavy exports in a process pool instead of the web worker
+    
+    Job state and rendered files live in a spool directory, so a job can be
+    polled and downloaded through any gunicorn worker. Jobs older than the
+    time-to-live are removed when new jobs are submitted.
+    """
+    
+    def __init__(self, directory, pool, ttl=3600):
+        self.directory = directory
+        self.pool = pool
+        self.ttl = ttl
+        os.makedirs(directory, exist_ok=True)
+    
+    def submit(self, schedule, month_name, extension, group_by_post=False):
+        """
+        Queue an export and return its job ID
+        """
+        self._purge()
+        
+        job_id = uuid.uuid4().hex
+        status = {
+            'job_id': job_id,
+            'format': extension,
+            'status': 'queued',
+            'progress': 0.0,
+            'employees': len(schedule),
+            'filename': f'duty_schedule_{month_name}_{schedule.year}.{extension}',
+            'created': time.time()
+        }
+        write_job_status(self.directory, status)
+        
+        args = (run_export_job, self.directory, status, schedule.to_bytes(), month_name, group_by_post)
+        future = self.pool.submit(*args)
+        future.add_done_callback(lambda f: self._check_job(job_id, f))
+        
+        logger.info(f"Queued {extension} export job {job_id} for {len(schedule)} employees")
+        return job_id
+    
+    def _check_job(self, job_id, future):
+        """
+        Mark a job as failed when its pool process did not finish it
+        
+        run_export_job records its own errors, so this only sees failures
+        outside it, such as a pool process being killed (BrokenProcessPool).
+        """
+        if future.cancelled():
+            error = 'Export job was cancelled'
+        else:
+            exception = future.exception()
+            if exception is None:
+                return
+            error = str(exception) or type(exception).__name__
+        
+        logger.error(f"Export job {job_id} failed in the pool: {error}")
+        status = self.status(job_id)
+        if status is None:
+            return
+        status['status'] = 'failed'
+        status['error'] = error
+        status['finished'] = time.time()
+        write_job_status(self.directory, status)
+    
+    def status(self, job_id):
+        """
+        Return the status dictionary of a job, or None if it is unknown
+        """
+        if not JOB_ID_PATTERN.fullmatch(job_id):
+            return None
+        try:
+            with open(os.path.join(self.directory, f'{job_id}.json')) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+    
+    def artifact_path(self, job_id, extension):
+        return os.path.join(self.directory, f'{job_id}.{extension}')
+    
+    def _purge(self):
+        cutoff = time.time() - self.ttl
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                try:
+                    if entry.stat().st_mtime < cutoff:
+                        os.remove(entry.path)
+                except FileNotFoundError:
+                    pass
+
+export_jobs = ExportJobQueue(EXPORT_JOB_DIR, worker_pool, ttl=EXPORT_JOB_TTL)
+
+@app.route('/jobs', methods=['POST'])
+def create_job():
+    """
+    Queue an Excel or PDF export to be rendered in the background
+    
+    Takes a format ('xlsx' or 'pdf') and either a schedule_id from /generate
+    or the full schedule payload accepted by /export.
+    """
+    try:
+        data = request.get_json()
+        
+        if not data:
+            logger.warning("No JSON data received for export job")
+            return jsonify({"error": "No data provided"}), 400
+        
+        extension = data.get('format')
+        if extension not in EXPORT_FORMATS:
+            return jsonify({"error": f"Unsupported export format: {extension}"}), 400
+        
+        if data.get('schedule_id'):
+            schedule = schedule_store.get(data['schedule_id'])
+            if schedule is None:
+                return jsonify({"error": "Schedule not found"}), 404
+            month_name = schedule.month_name
+        else:
+            try:
+                schedule, month_name = schedule_from_payload(data)
+            except ValueError as e:
+                return jsonify({"error": str(e)}), 400
+            if schedule is None:
+                return jsonify({"error": "Incomplete schedule data provided"}), 400
+        
+        job_id = export_jobs.submit(schedule, month_name, extension, bool(data.get('group_by_post')))
+        
+        return jsonify({
+            'job_id': job_id,
+            'status_url': url_for('job_status', job_id=job_id)
+        }), 202
+    except Exception as e:
+        logger.error(f"Error queueing export job: {str(e)}", exc_info=True)
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    """
+    Report the progress of an export job, with a download link once it is done
+    """
+    try:
+        status = export_jobs.status(job_id)
+        if status is None:
+            return jsonify({"error": "Job not found"}), 404
+        
+        if status['status'] == 'done':
+            status['download_url'] = url_for('job_file', job_id=job_id)
+        return jsonify(status)
+    except Exception as e:
+        logger.error(f"Error reading export job {job_id}: {str(e)}", exc_info=True)
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/jobs/<job_id>/file')
+def job_file(job_id):
+    """
+    Download the file rendered by a finished export job
+    """
+    try:
+        status = export_jobs.status(job_id)
+        if status is None:
+            return jsonify({"error": "Job not found"}), 404
+        if status['status'] != 'done':
+            return jsonify({"error": f"Job is {status['status']}"}), 409
+        
+        extension = status['format']
+        return send_file(
+            export_jobs.artifact_path(job_id, extension),
+            mimetype=EXPORT_FORMATS[extension][1],
+            as_attachment=True,
+            download_name=status['filename']
+        )
+    except Exception as e:
+        logger.error(f"Error sending export job {job_id} file: {str(e)}", exc_info=True)
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/rosters', methods=['GET', 'POST'])
+def rosters():
+    """
+    List the saved rosters, or save a new one
+    
+    POST expects {"name": ..., "employees": [employee, ...]}. Invalid
+    employees are left out and reported, as in /generate.
+    """
+    try:
+        if request.method == 'GET':
+            return json_response({'rosters': roster_store.list_rosters()})
+        
+        data = request.get_json()
+        if not data:
+            return jsonify({"error": "No data provided"}), 400
+        
+        errors = []
+        employees = DutyScheduler().clean_employees(data.get('employees', []), errors)
+        if not employees:
+            return jsonify({"error": "No valid employees provided", "errors": errors}), 400
+        
+        name = data.get('name') or f"Roster of {len(employees)} employees"
+        roster_id = roster_store.create_roster(str(name), employees)
+        logger.info(f"Saved roster {roster_id} with {len(employees)} employees")
+        return json_response({
+            'roster_id': roster_id,
+            'name': name,
+            'employees': len(employees),
+            'errors': errors
+        }, 201)
+    except Exception as e:
+        logger.error(f"Error saving roster: {str(e)}", exc_info=True)
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/rosters/<int:roster_id>', methods=['GET', 'PUT', 'DELETE'])
+def roster(roster_id):
+    """
+    Read, replace or delete one saved roster
+    
+    PUT expects the same JSON as POST /rosters and replaces every employee.
+    """
+    try:
+        if request.method == 'GET':
+            result = roster_store.get_roster(roster_id)
+            if result is None:
+                return jsonify({"error": "Roster not found"}), 404
+            return json_response(result)
+        
+        if request.method == 'DELETE':
+            if not roster_store.delete_roster(roster_id):
+                return jsonify({"error": "Roster not found"}), 404
+            logger.info(f"Deleted roster {roster_id}")
+            return json_response({'roster_id': roster_id, 'deleted': True})
+        
+        data = request.get_json()
+        if not data:
+            return jsonify({"error": "No data provided"}), 400
+        
+        errors = []
+        employees = DutyScheduler().clean_employees(data.get('employees', []), errors)
+        if not employees:
+            return jsonify({"error": "No valid employees provided", "errors": errors}), 400
+        
+        if not roster_store.replace_roster(roster_id, employees, data.get('name')):
+            return jsonify({"error": "Roster not found"}), 404
+        logger.info(f"Replaced roster {roster_id} with {len(employees)} employees")
+        return json_response({'roster_id': roster_id, 'employees': len(employees), 'errors': errors})
+    except Exception as e:
+        logger.error(f"Error updating roster {roster_id}: {str(e)}", exc_info=True)
+        return jsonify({"error": str(e)}), 500
+
+# Rest day names accepted by the CSV import, as the client's numbers (0 = Sunday)
+REST_DAY_NAMES = {
+    name.lower(): (weekday + 1) % 7
+    for names in (calendar.day_name, calendar.day_abbr)
+    for weekday, name in enumerate(names)
+}
+
+def read_roster_csv(text, default_post=None):
+    """
+    Read employee records from CSV text with a header row
+    
+    Columns are name, code, post, start_shift and rest_day, plus an optional
+    locked column. rest_day is a number (0 = Sunday) or a weekday name. The
+    records are not validated here; clean_employees does that.
+    
+    Args:
+        text: The CSV text
+        default_post: Post for rows without one
+        
+    Returns:
+        A list of employee dictionaries
+    """
+    records = []
+    for row in csv.DictReader(io.StringIO(text)):
+        record = {
+            key.strip().lower(): value.strip()
+            for key, value in row.items()
+            if key is not None and value is not None
+        }
+        if not record.get('post') and default_post:
+            record['post'] = default_post
+        if 'start_shift' in record:
+            record['start_shift'] = record['start_shift'].upper()
+        rest_day = record.get('rest_day')
+        if rest_day is not None and rest_day.lower() in REST_DAY_NAMES:
+            record['rest_day'] = REST_DAY_NAMES[rest_day.lower()]
+        if 'locked' in record:
+            record['locked'] = record['locked'].lower() in ('1', 'true', 'yes')
+        records.append(record)
+    return records
+
+@app.route('/import/csv', methods=['POST'])
+def import_csv():
+    """
+    Generate a schedule from a CSV roster
+    
+    The CSV is the request body, or the file of a multipart upload. Query
+    parameters: year and month of the schedule, post for rows without one,
+    and save=1 with an optional name to keep the roster as well. The
+    response is the /generate summary without the schedule rows, which are
+    fetched from the export URLs it lists. The row of a rejected record
+    counts data rows from 0, so it is on line row + 2 of the file.
+    """
+    try:
+        start_time = time.perf_counter()
+        # A malformed year or month is an error, not a fallback to today
+        try:
+            year = int(request.args.get('year', datetime.now().year))
+            month = int(request.args.get('month', datetime.now().month))
+            calendar.monthrange(year, month)
+        except (TypeError, ValueError) as e:
+            logger.warning(f"Invalid year or month for CSV import: {str(e)}")
+            return jsonify({"error": f"Invalid year or month: {str(e)}"}), 400
+        
+        upload = next(iter(request.files.values()), None)
+        data = upload.read() if upload is not None else request.get_data()
+        if not data:
+            return jsonify({"error": "No CSV data provided"}), 400
+        try:
+            text = data.decode('utf-8-sig')
+        except UnicodeDecodeError:
+            return jsonify({"error": "The CSV must be UTF-8 encoded"}), 400
+        
+        records = read_roster_csv(text, request.args.get('post'))
+        if not records:
+            return jsonify({"error": "No employee data provided"}), 400
+        parsed_time = time.perf_counter()
+        
+        # Clean once; the same employees are generated and, with save, stored
+        scheduler = DutyScheduler()
+        errors = []
+        employees = scheduler.clean_employees(records, errors)
+        schedule = scheduler.generate_schedule(employees, year, month)
+        if not schedule:
+            logger.error("CSV roster has no valid employees")
+            return jsonify({
+                "error": "Unable to generate schedule due to invalid employee data",
+                "errors": errors
+            }), 400
+        schedule_id = schedule_store.put(schedule)
+        
+        result = {
+            'schedule_id': schedule_id,
+            'month': month,
+            'year': year,
+            'month_name': calendar.month_name[month],
+            'employees': len(schedule),
+            'errors': errors,
+            'coverage': schedule.coverage(),
+            'export_urls': {
+                'csv': url_for('export_csv', schedule_id=schedule_id),
+                'ndjson': url_for('export_ndjson', schedule_id=schedule_id),
+                'xlsx': url_for('export_stored', schedule_id=schedule_id),
+                'pdf': url_for('export_pdf_stored', schedule_id=schedule_id),
+                'ics_zip': url_for('export_ics_zip', schedule_id=schedule_id)
+            }
+        }
+        if request.args.get('save', '0').lower() in ('1', 'true'):
+            roster_id = roster_store.create_roster(
+                request.args.get('name') or f"CSV import of {len(schedule)} employees",
+                employees
+            )
+            roster_store.save_schedule(schedule_id, schedule, roster_id)
+            result['roster_id'] = roster_id
+        
+        result['process_time'] = time.perf_counter() - start_time
+        log_event(
+            'import_csv',
+            schedule_id=schedule_id,
+            period=f'{year}-{month:02d}',
+            employees=len(records),
+            rejected=len(errors),
+            saved='roster_id' in result,
+            parse_ms=round((parsed_time - start_time) * 1000, 2),
+            total_ms=round(result['process_time'] * 1000, 2)
+        )
+        return json_response(result)
+    except Exception as e:
+        logger.error(f"Error importing CSV roster: {str(e)}", exc_info=True)
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/employees')
+def find_employees():
+    """
+    Look up saved employees by code, e.g. /employees?code=1042
+    """
+    try:
+        code = request.args.get('code')
+        if not code:
+            return jsonify({"error": "code is required"}), 400
+        return json_response({'code': code, 'employees': roster_store.find_employees(code)})
+    except Exception as e:
+        logger.error(f"Error looking up employees: {str(e)}", exc_info=True)
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/schedules')
+def find_schedules():
+    """
+    Saved schedule rows of one post for one month, e.g. /schedules?post=HELPER&year=2025&month=3
+    """
+    try:
+        post = request.args.get('post')
+        year = request.args.get('year', type=int)
+        month = request.args.get('month', type=int)
+        if not post or year is None or month is None:
+            return jsonify({"error": "post, year and month are required"}), 400
+        return json_response({
+            'post': post,
+            'year': year,
+            'month': month,
+            'rows': roster_store.find_schedule_rows(post, year, month)
+        })
+    except Exception as e:
+        logger.error(f"Error looking up schedules: {str(e)}", exc_info=True)
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """
+    Expose this worker's metrics in the Prometheus text format
+    """
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.errorhandler(404)
+def page_not_found(e):
+    return jsonify({"error": "Resource not found"}), 404
+
+@app.errorhandler(500)
+def internal_server_error(e):
+    return jsonify({"error": "Internal server error"}), 500
+
+IMPORT_TIMES['app'] = time.perf_counter() - IMPORT_START
+logger.info(f"Imported app in {IMPORT_TIMES['app'] * 1000:.1f} ms")
 
 if __name__ == '__main__':
     # Get port from environment variable or use 5000 as default
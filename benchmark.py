@@ -0,0 +1,247 @@
+"""
+Benchmarks for the scheduling and export paths
+
+Generates synthetic rosters covering every start shift and rest day, times
+DutyScheduler.generate_schedule directly and /generate, /export and
+/export_pdf through a test client, and reports p50/p99 latency, throughput
+and peak memory. Results are written as JSON so runs can be compared.
+
+Usage:
+    python benchmark.py
+    python benchmark.py --sizes 10,1000,50000 --repeat 10 --output results.json
+"""
+import argparse
+import json
+import logging
+import platform
+import random
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+from werkzeug.test import Client
+
+import app as duty_app
+
+# One month of each length: 28, 29, 30 and 31 days
+MONTHS = ((2025, 2), (2024, 2), (2025, 4), (2025, 3))
+
+START_SHIFTS = ('A', 'B', 'C', 'G')
+
+def make_roster(size, seed):
+    """
+    Build a roster of the given size with every start shift and rest day mix
+    
+    Args:
+        size: Number of employees
+        seed: Seed for the shuffle, so the same arguments give the same roster
+        
+    Returns:
+        A list of employee dictionaries as the front end sends them
+    """
+    rng = random.Random(seed)
+    mixes = [(shift, rest_day) for shift in START_SHIFTS for rest_day in range(7)]
+    posts = ('SUPERVISOR', 'HELPER', 'TECHNICIAN')
+    roster = []
+    for i in range(size):
+        start_shift, rest_day = mixes[i % len(mixes)]
+        roster.append({
+            'name': f'Employee {i:05d}',
+            'code': f'{10000 + i}',
+            'post': posts[i % len(posts)],
+            'start_shift': start_shift,
+            'rest_day': rest_day
+        })
+    rng.shuffle(roster)
+    return roster
+
+def percentile(values, fraction):
+    """
+    Nearest-rank percentile of a list of values
+    """
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(fraction * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+def measure(run, repeat, setup=None):
+    """
+    Time a benchmark and measure its peak memory in one extra traced run
+    
+    One untimed warm-up run comes first, so lazy imports and first-use
+    setup are not counted as latency.
+    
+    Args:
+        run: Function performing one iteration
+        repeat: Number of timed iterations
+        setup: Optional function called untimed before every iteration
+        
+    Returns:
+        A tuple of (list of seconds per iteration, peak traced bytes)
+    """
+    if setup:
+        setup()
+    run()
+    
+    timings = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        run()
+        timings.append(time.perf_counter() - start)
+    
+    # tracemalloc slows everything down, so memory gets its own run
+    if setup:
+        setup()
+    tracemalloc.start()
+    run()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    
+    return timings, peak
+
+def summarize(name, employees, days, timings, peak):
+    p50 = percentile(timings, 0.5)
+    return {
+        'benchmark': name,
+        'employees': employees,
+        'days': days,
+        'runs': len(timings),
+        'p50_ms': round(p50 * 1000, 3),
+        'p99_ms': round(percentile(timings, 0.99) * 1000, 3),
+        'mean_ms': round(sum(timings) / len(timings) * 1000, 3),
+        'throughput_employees_per_s': round(employees / p50, 1) if p50 else None,
+        'peak_memory_bytes': peak
+    }
+
+def reset_caches():
+    duty_app.DutyScheduler.clear_pattern_cache()
+    duty_app.artifact_cache.clear()
+
+def check_response(response, name):
+    if response.status_code != 200:
+        raise RuntimeError(f"{name} returned {response.status_code}: {response.get_data(as_text=True)[:200]}")
+    # Drain streamed bodies so the whole response is part of the timing
+    response.get_data()
+
+def run_benchmarks(sizes, repeat, seed, export_max):
+    """
+    Run every benchmark for every roster size
+    
+    Args:
+        sizes: Roster sizes to benchmark
+        repeat: Timed iterations per benchmark
+        seed: Seed for the synthetic rosters
+        export_max: Largest roster size also run through the export benchmarks
+        
+    Returns:
+        A list of result dictionaries
+    """
+    client = Client(duty_app.app)
+    scheduler = duty_app.DutyScheduler()
+    results = []
+    
+    for size in sizes:
+        roster = make_roster(size, seed)
+        
+        for year, month in MONTHS:
+            days = duty_app.calendar.monthrange(year, month)[1]
+            timings, peak = measure(
+                lambda: scheduler.generate_schedule(roster, year, month),
+                repeat,
+                setup=reset_caches
+            )
+            results.append(summarize('generate_schedule', size, days, timings, peak))
+            print_result(results[-1])
+        
+        year, month = MONTHS[-1]
+        days = duty_app.calendar.monthrange(year, month)[1]
+        payload = {'employees': roster, 'year': year, 'month': month}
+        timings, peak = measure(
+            lambda: check_response(client.post('/generate', json=payload), '/generate'),
+            repeat,
+            setup=reset_caches
+        )
+        results.append(summarize('generate_http', size, days, timings, peak))
+        print_result(results[-1])
+        
+        if size > export_max:
+            continue
+        
+        generated = client.post('/generate', json=payload).get_json()
+        export_payload = {
+            'schedule': generated['schedule'],
+            'year': generated['year'],
+            'month': generated['month'],
+            'month_name': generated['month_name']
+        }
+        for name, url in (('export_xlsx', '/export'), ('export_pdf', '/export_pdf')):
+            timings, peak = measure(
+                lambda: check_response(client.post(url, json=export_payload), url),
+                repeat,
+                setup=reset_caches
+            )
+            results.append(summarize(name, size, days, timings, peak))
+            print_result(results[-1])
+    
+    return results
+
+def print_result(result):
+    print(f"{result['benchmark']:<18} {result['employees']:>7} emp {result['days']:>2} days  "
+          f"p50 {result['p50_ms']:>10.2f} ms  p99 {result['p99_ms']:>10.2f} ms  "
+          f"{result['throughput_employees_per_s'] or 0:>12.0f} emp/s  "
+          f"peak {result['peak_memory_bytes'] / 1048576:>8.1f} MB")
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark schedule generation and exports')
+    parser.add_argument('--sizes', default='10,100,1000,10000,50000',
+                        help='Comma-separated roster sizes (default: %(default)s)')
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='Timed iterations per benchmark (default: %(default)s)')
+    parser.add_argument('--seed', type=int, default=42,
+                        help='Seed for the synthetic rosters (default: %(default)s)')
+    parser.add_argument('--export-max', type=int, default=10000,
+                        help='Largest roster size also run through the exports (default: %(default)s)')
+    parser.add_argument('--output',
+                        default=os.path.join(tempfile.gettempdir(), 'duty-scheduler', 'benchmark_results.json'),
+                        help='File the JSON results are written to (default: %(default)s)')
+    args = parser.parse_args()
+    
+    sizes = [int(size) for size in args.sizes.split(',') if size.strip()]
+    
+    # Per-request log lines would dominate the small benchmarks
+    logging.getLogger(duty_app.__name__).setLevel(logging.WARNING)
+    
+    results = run_benchmarks(sizes, args.repeat, args.seed, args.export_max)
+    
+    report = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'git_revision': git_revision(),
+            'python': sys.version.split()[0],
+            'platform': platform.platform(),
+            'sizes': sizes,
+            'repeat': args.repeat,
+            'seed': args.seed
+        },
+        'results': results
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+
+if __name__ == '__main__':
+    main()
@@ -1,7 +1,19 @@
+import os
+
 bind = "0.0.0.0:10000"
 workers = 4
 threads = 2
 worker_class = "sync"
 worker_connections = 1000
 timeout = 30
-keepalive = 2 
\ No newline at end of file
+keepalive = 2
+
+# Import the app (and, below, its export backends) once in the master so the
+# forked workers share those pages instead of each importing them
+preload_app = os.environ.get('GUNICORN_PRELOAD', '0') == '1'
+
+def when_ready(server):
+    if preload_app:
+        import app
+        app.preload_export_backends()
+        server.log.info(f"Preloaded app, import times (ms): {app.import_report()}")
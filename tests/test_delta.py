@@ -0,0 +1,63 @@
+import pytest
+from werkzeug.test import Client
+
+import app
+
+
+def roster(size):
+    return [
+        {'name': f'Employee {index}', 'code': str(index), 'post': 'Helper' if index % 3 else 'Supervisor',
+         'start_shift': 'ABCG'[index % 4], 'rest_day': index % 7}
+        for index in range(size)
+    ]
+
+
+@pytest.mark.parametrize('compact', [False, True])
+def test_delta_matches_full_generate_of_edited_roster(compact):
+    client = Client(app.app)
+    employees = roster(12)
+    base = client.post('/generate', json={'year': 2024, 'month': 2, 'employees': employees})
+    assert base.status_code == 200
+    
+    edited = dict(employees[4], start_shift='C', rest_day=2)
+    added = {'name': 'New hire', 'code': '99', 'post': 'Helper', 'start_shift': 'B', 'rest_day': 5}
+    delta = client.post(f"/generate/{base.json['schedule_id']}/delta", json={
+        'upsert': [edited, added],
+        'remove': [employees[7]['name'], 'Nobody'],
+        'compact': compact
+    })
+    assert delta.status_code == 200
+    
+    # Edited rows stay in place, new ones are added at the end
+    expected_roster = [edited if emp['name'] == edited['name'] else emp
+                       for emp in employees if emp['name'] != employees[7]['name']] + [added]
+    full = client.post('/generate', json={
+        'year': 2024, 'month': 2, 'employees': expected_roster, 'compact': compact
+    })
+    assert full.status_code == 200
+    
+    assert delta.json['schedule_id'] == full.json['schedule_id']
+    assert delta.json['coverage'] == full.json['coverage']
+    assert delta.json['removed'] == [employees[7]['name']]
+    assert delta.json['employees'] == len(expected_roster)
+    assert delta.json['rows'] == {
+        name: full.json['schedule'][name] for name in (edited['name'], added['name'])
+    }
+    
+    # The stored schedule behind the new ID has every row of the full generate
+    stored = app.schedule_store.get(delta.json['schedule_id'])
+    assert stored.to_dict(compact) == full.json['schedule']
+
+
+@pytest.mark.parametrize('payload', [
+    {'remove': [['Employee 1']]},
+    {'remove': [1]},
+    {'upsert': ['Employee 1']},
+    {'upsert': [[['name', 'Employee 1']]]},
+    {'upsert': {'name': 'Employee 1'}},
+])
+def test_delta_rejects_malformed_entries(payload):
+    client = Client(app.app)
+    base = client.post('/generate', json={'year': 2024, 'month': 2, 'employees': roster(3)})
+    response = client.post(f"/generate/{base.json['schedule_id']}/delta", json=payload)
+    assert response.status_code == 400
@@ -0,0 +1,69 @@
+from app import Schedule, diff_schedules
+
+
+def schedule_of(rows, year=2025, month=3, start_day=1):
+    """
+    Build a Schedule from {name: shifts} with one shift letter per day
+    """
+    num_days = len(next(iter(rows.values())))
+    schedule = Schedule(year, month, num_days, start_day)
+    for index, (name, shifts) in enumerate(rows.items()):
+        schedule.set_row(name, str(index), 'Helper', shifts.encode('ascii'))
+    return schedule
+
+
+def test_diff_reports_changed_cells_and_added_and_removed_employees():
+    old = schedule_of({
+        'Amy': 'AAAARCC',
+        'Moe': 'BBBRAAA',
+        'Zed': 'CCRBBBB'
+    })
+    new = schedule_of({
+        'Moe': 'BBCRAAB',
+        'Amy': 'AAAARCC',
+        'Kim': 'GGGGGRG'
+    })
+    diff = diff_schedules(old, new)
+    
+    assert diff['days'] == list(range(1, 8))
+    assert diff['changes'] == [('Moe', 3, 'B', 'C'), ('Moe', 7, 'A', 'B')]
+    assert diff['added'] == ['Kim']
+    assert diff['removed'] == ['Zed']
+    # Row order does not matter, only names
+    assert diff['unchanged'] == 1
+
+
+def test_diff_of_identical_schedules_is_empty():
+    rows = {'Amy': 'AAAARCC', 'Moe': 'BBBRAAA'}
+    diff = diff_schedules(schedule_of(rows), schedule_of(rows))
+    
+    assert diff['changes'] == []
+    assert diff['added'] == diff['removed'] == []
+    assert diff['unchanged'] == 2
+
+
+def test_diff_of_different_month_lengths_marks_missing_days():
+    old = schedule_of({'Amy': 'A' * 28, 'Moe': 'B' * 28}, month=2)
+    new = schedule_of({'Amy': 'A' * 28 + 'RCC', 'Moe': 'B' * 31})
+    diff = diff_schedules(old, new)
+    
+    assert diff['days'] == list(range(1, 32))
+    assert diff['changes'] == [
+        ('Amy', 29, None, 'R'), ('Amy', 30, None, 'C'), ('Amy', 31, None, 'C'),
+        ('Moe', 29, None, 'B'), ('Moe', 30, None, 'B'), ('Moe', 31, None, 'B')
+    ]
+    assert diff['unchanged'] == 0
+
+
+def test_diff_matches_days_of_partial_months_by_date():
+    # Days 10-14 against days 12-16 overlap on 12-14
+    old = schedule_of({'Amy': 'AARCC'}, start_day=10)
+    new = schedule_of({'Amy': 'RCCBB'}, start_day=12)
+    diff = diff_schedules(old, new)
+    
+    assert diff['days'] == list(range(10, 17))
+    assert diff['changes'] == [
+        ('Amy', 10, 'A', None), ('Amy', 11, 'A', None),
+        ('Amy', 15, None, 'B'), ('Amy', 16, None, 'B')
+    ]
+    assert diff['unchanged'] == 0
@@ -0,0 +1,35 @@
+import io
+
+import openpyxl
+from werkzeug.test import Client
+
+import app
+
+
+def xlsx_names(data):
+    """
+    Employee names of an Excel export, top to bottom
+    """
+    sheet = openpyxl.load_workbook(io.BytesIO(data)).active
+    return [row[1] for row in sheet.iter_rows(values_only=True) if isinstance(row[0], int)]
+
+
+def test_stored_export_lists_employees_in_generate_order():
+    client = Client(app.app)
+    employees = [
+        {'name': name, 'code': str(index), 'post': 'Helper', 'start_shift': 'ABC'[index], 'rest_day': index}
+        for index, name in enumerate(['Zed', 'Amy', 'Moe'])
+    ]
+    generated = client.post('/generate', json={'year': 2025, 'month': 3, 'employees': employees, 'compact': True})
+    assert generated.status_code == 200
+    names = list(generated.json['schedule'])
+    assert names == ['Zed', 'Amy', 'Moe']
+    
+    stored = client.get(f"/export/{generated.json['schedule_id']}.xlsx")
+    assert stored.status_code == 200
+    assert xlsx_names(stored.get_data()) == names
+    
+    # The upload fallback gets the schedule as the page holds it
+    uploaded = client.post('/export', json=generated.json)
+    assert uploaded.status_code == 200
+    assert xlsx_names(uploaded.get_data()) == names
@@ -0,0 +1,101 @@
+from app import Schedule, build_ics, fold_ics_line, ics_escape
+
+STAMP = '20250301T000000Z'
+
+
+def unfold(data):
+    """
+    Physical lines of an iCalendar file joined back into content lines
+    """
+    assert data.endswith(b'\r\n')
+    return data.replace(b'\r\n ', b'').decode('utf-8').split('\r\n')[:-1]
+
+
+def events(data):
+    """
+    The properties of every VEVENT, as dictionaries
+    """
+    found = []
+    for line in unfold(data):
+        if line == 'BEGIN:VEVENT':
+            found.append({})
+        elif found and line != 'END:VEVENT' and ':' in line:
+            key, value = line.split(':', 1)
+            found[-1].setdefault(key, value)
+    return found
+
+
+def test_ics_escape_text_values():
+    assert ics_escape('a,b;c\\d') == 'a\\,b\\;c\\\\d'
+    assert ics_escape('one\ntwo\r\nthree') == 'one\\ntwo\\nthree'
+    assert ics_escape(42) == '42'
+
+
+def test_short_lines_are_not_folded():
+    line = 'X' * 75
+    assert fold_ics_line(line) == line.encode('ascii') + b'\r\n'
+
+
+def test_long_lines_fold_at_75_octets():
+    line = 'DESCRIPTION:' + 'abcdefghij' * 30
+    folded = fold_ics_line(line)
+    physical = folded.split(b'\r\n')[:-1]
+    
+    assert len(physical) > 1
+    assert all(len(part) <= 75 for part in physical)
+    assert len(physical[0]) == 75
+    assert all(part.startswith(b' ') for part in physical[1:])
+    assert unfold(folded) == [line]
+
+
+def test_folding_never_splits_a_utf8_character():
+    line = 'SUMMARY:' + 'é€' * 60
+    folded = fold_ics_line(line)
+    physical = folded.split(b'\r\n')[:-1]
+    
+    assert all(len(part) <= 75 for part in physical)
+    for part in physical:
+        part.decode('utf-8')
+    assert unfold(folded) == [line]
+
+
+def test_build_ics_compresses_runs_into_rrules():
+    schedule = Schedule(2025, 3, 10)
+    schedule.set_row('Amy', '7', 'Helper', b'AAARCCBRRG')
+    data = build_ics(schedule, 0, 'abc123', STAMP)
+    found = events(data)
+    
+    # Rest days have no events
+    assert [event['DTSTART'] for event in found] == [
+        '20250301T060000', '20250305T220000', '20250307T140000', '20250310T090000'
+    ]
+    assert found[0]['RRULE'] == 'FREQ=DAILY;COUNT=3'
+    assert found[0]['DTEND'] == '20250301T140000'
+    # The C shift ends at 06:00 the next day
+    assert found[1]['RRULE'] == 'FREQ=DAILY;COUNT=2'
+    assert found[1]['DTEND'] == '20250306T060000'
+    # Single days have no RRULE
+    assert 'RRULE' not in found[2]
+    assert 'RRULE' not in found[3]
+    assert found[3]['DTEND'] == '20250310T170000'
+    assert len({event['UID'] for event in found}) == len(found)
+    assert all(event['DTSTAMP'] == STAMP for event in found)
+
+
+def test_build_ics_escapes_and_folds_employee_details():
+    name = 'Smith, John; "Night lead" ' + 'x' * 80
+    schedule = Schedule(2025, 3, 2, start_day=30)
+    schedule.set_row(name, '12', 'Helper', b'CC')
+    data = build_ics(schedule, 0, 'abc123', STAMP)
+    
+    assert all(len(line) <= 75 for line in data.split(b'\r\n'))
+    content = unfold(data)
+    assert f'X-WR-CALNAME:Duty schedule - {ics_escape(name)}' in content
+    assert f'DESCRIPTION:{ics_escape(name)} (12)\\, Helper' in content
+    assert content[0] == 'BEGIN:VCALENDAR' and content[-1] == 'END:VCALENDAR'
+    
+    event, = events(data)
+    # A partial month starts on its first day
+    assert event['DTSTART'] == '20250330T220000'
+    assert event['DTEND'] == '20250331T060000'
+    assert event['RRULE'] == 'FREQ=DAILY;COUNT=2'
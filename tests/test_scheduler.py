@@ -0,0 +1,106 @@
+import calendar
+from datetime import date, timedelta
+
+import pytest
+
+from app import DutyScheduler
+
+
+def month_shapes():
+    """
+    One (year, month) for every month length and first weekday
+    """
+    shapes = {}
+    for year in range(2000, 2040):
+        for month in range(1, 13):
+            first_weekday, num_days = calendar.monthrange(year, month)
+            shapes.setdefault((num_days, first_weekday), (year, month))
+    return sorted(shapes.items())
+
+
+def all_patterns():
+    """
+    One employee for every start shift and rest day
+    """
+    return [
+        {
+            'name': f'Employee {start_shift}{rest_day}',
+            'code': f'{start_shift}{rest_day}',
+            'post': 'Supervisor' if rest_day % 2 else 'Helper',
+            'start_shift': start_shift,
+            'rest_day': rest_day
+        }
+        for start_shift in ('A', 'B', 'C', 'G')
+        for rest_day in range(7)
+    ]
+
+
+def test_month_shapes_cover_every_length_and_weekday():
+    shapes = [shape for shape, _ in month_shapes()]
+    assert len(shapes) == 4 * 7
+    assert {num_days for num_days, _ in shapes} == {28, 29, 30, 31}
+
+
+@pytest.mark.parametrize(
+    'year, month',
+    [year_month for _, year_month in month_shapes()],
+    ids=[f'{num_days}days-weekday{first_weekday}' for (num_days, first_weekday), _ in month_shapes()]
+)
+def test_generate_schedule_matches_reference(year, month):
+    scheduler = DutyScheduler()
+    employees = all_patterns()
+    
+    schedule = scheduler.generate_schedule(employees, year, month)
+    reference = scheduler.generate_schedule_reference(employees, year, month)
+    
+    assert len(reference) == len(employees)
+    assert schedule.to_dict() == reference
+    assert schedule.to_dict(compact=True) == {
+        name: dict(row, shifts=''.join(row['shifts'])) for name, row in reference.items()
+    }
+
+
+def continuous_rotation(employee, start_date, end_date):
+    """
+    Walk one employee's rotation day by day through the whole range
+    """
+    rotation = {'A': 'C', 'C': 'B', 'B': 'A'}
+    rest_weekday = 6 if employee['rest_day'] == 0 else employee['rest_day'] - 1
+    current_shift = employee['start_shift']
+    was_rest_day = False
+    shifts = []
+    day = start_date
+    while day <= end_date:
+        if day.weekday() == rest_weekday:
+            shifts.append('R')
+            was_rest_day = True
+        else:
+            if was_rest_day and current_shift != 'G':
+                current_shift = rotation[current_shift]
+                was_rest_day = False
+            shifts.append(current_shift)
+        day += timedelta(days=1)
+    return ''.join(shifts)
+
+
+@pytest.mark.parametrize('start_date, end_date', [
+    (date(2025, 1, 1), date(2025, 1, 31)),
+    (date(2025, 1, 15), date(2025, 3, 14)),
+    (date(2024, 1, 20), date(2024, 4, 10)),
+    (date(2023, 2, 5), date(2023, 3, 5)),
+    (date(2024, 12, 29), date(2025, 1, 2)),
+    (date(2025, 3, 31), date(2025, 4, 1)),
+    (date(2025, 1, 1), date(2025, 12, 31)),
+])
+def test_generate_schedule_range_matches_one_continuous_rotation(start_date, end_date):
+    employees = all_patterns()
+    months = list(DutyScheduler().generate_schedule_range(employees, start_date, end_date))
+    
+    # One window per calendar month, covering the range without gaps
+    assert (months[0].year, months[0].month, months[0].start_day) == \
+        (start_date.year, start_date.month, start_date.day)
+    assert sum(schedule.num_days for schedule in months) == (end_date - start_date).days + 1
+    
+    for employee in employees:
+        joined = ''.join(schedule.shifts(schedule.index(employee['name'])) for schedule in months)
+        assert joined == continuous_rotation(employee, start_date, end_date)
@@ -0,0 +1,152 @@
+import calendar
+
+import pytest
+
+from app import DutyScheduler
+
+YEAR, MONTH = 2025, 3
+NUM_DAYS = calendar.monthrange(YEAR, MONTH)[1]
+
+
+def roster(size, start_shift='A', rest_day=0):
+    """
+    A roster of size employees that all start on the same pattern
+    """
+    return [
+        {'name': f'Employee {index}', 'code': str(index), 'post': 'Helper',
+         'start_shift': start_shift, 'rest_day': rest_day}
+        for index in range(size)
+    ]
+
+
+def solve(employees, min_coverage, **solver_options):
+    scheduler = DutyScheduler()
+    report = {}
+    schedule = scheduler.generate_schedule(
+        employees, YEAR, MONTH, [], min_coverage, solver_options, report
+    )
+    return schedule, report
+
+
+def solved_roster(employees, report):
+    """
+    The roster with the solver's changes applied
+    """
+    changes = {change['name']: change for change in report['changes']}
+    return [dict(emp, **{key: changes[emp['name']][key] for key in ('start_shift', 'rest_day')})
+            if emp['name'] in changes else emp for emp in employees]
+
+
+def assert_rotation_kept(employees, schedule, report):
+    """
+    Every row is a plain rotation of its new start shift and rest day
+    """
+    final = solved_roster(employees, report)
+    assert schedule.to_dict() == DutyScheduler().generate_schedule_reference(final, YEAR, MONTH)
+    
+    for emp in final:
+        shifts = schedule.shifts(schedule.index(emp['name']))
+        weekday = 6 if emp['rest_day'] == 0 else emp['rest_day'] - 1
+        rest_days = [day for day in range(1, NUM_DAYS + 1) if shifts[day - 1] == 'R']
+        assert rest_days == [day for day in range(1, NUM_DAYS + 1)
+                             if calendar.weekday(YEAR, MONTH, day) == weekday]
+
+
+def test_feasible_targets_are_met():
+    employees = roster(30)
+    min_coverage = {'A': 6, 'B': 6, 'C': 6}
+    schedule, report = solve(employees, min_coverage)
+    
+    assert report['status'] == 'met'
+    assert report['shortfall'] == 0
+    assert not report['timed_out']
+    coverage = schedule.coverage()
+    for shift, target in min_coverage.items():
+        assert min(coverage[shift]) >= target
+    assert_rotation_kept(employees, schedule, report)
+
+
+def test_daily_targets_are_met():
+    employees = roster(40, 'B', 3)
+    daily = [4 if day % 2 else 8 for day in range(NUM_DAYS)]
+    schedule, report = solve(employees, {'A': daily, 'C': 5})
+    
+    assert report['status'] == 'met'
+    coverage = schedule.coverage()
+    assert all(count >= target for count, target in zip(coverage['A'], daily))
+    assert min(coverage['C']) >= 5
+    assert_rotation_kept(employees, schedule, report)
+
+
+def test_fixed_rest_days_only_change_start_shifts():
+    employees = [dict(emp, rest_day=index % 7) for index, emp in enumerate(roster(42))]
+    schedule, report = solve(employees, {'A': 8, 'B': 8, 'C': 8}, fixed_rest_days=True)
+    
+    assert report['changes']
+    for change in report['changes']:
+        original = next(emp for emp in employees if emp['name'] == change['name'])
+        assert change['rest_day'] == original['rest_day']
+    assert_rotation_kept(employees, schedule, report)
+
+
+def test_locked_and_g_shift_employees_keep_their_pattern():
+    employees = roster(20)
+    employees[0]['locked'] = True
+    employees[1]['start_shift'] = 'G'
+    schedule, report = solve(employees, {'B': 8, 'C': 8})
+    
+    moved = {change['name'] for change in report['changes']}
+    assert moved
+    assert employees[0]['name'] not in moved
+    assert employees[1]['name'] not in moved
+    assert_rotation_kept(employees, schedule, report)
+
+
+def test_met_targets_move_nobody():
+    employees = [dict(emp, start_shift='ABC'[index % 3], rest_day=index % 7)
+                 for index, emp in enumerate(roster(63))]
+    schedule, report = solve(employees, {'A': 1, 'B': 1, 'C': 1})
+    
+    assert report['status'] == 'met'
+    assert report['initial_shortfall'] == 0
+    assert report['changes'] == []
+    assert schedule.to_dict() == DutyScheduler().generate_schedule_reference(employees, YEAR, MONTH)
+
+
+def test_infeasible_targets_report_the_shortfall_left():
+    employees = roster(6)
+    schedule, report = solve(employees, {'A': 5, 'B': 5, 'C': 5})
+    
+    assert report['status'] == 'improved'
+    assert report['shortfall'] > 0
+    assert report['shortfall'] < report['initial_shortfall']
+    assert sum(sum(daily) for daily in report['shortfall_by_shift'].values()) == report['shortfall']
+    coverage = schedule.coverage()
+    for shift, daily in report['shortfall_by_shift'].items():
+        assert [max(0, 5 - count) for count in coverage[shift]] == daily
+    assert len(schedule) == len(employees)
+    assert_rotation_kept(employees, schedule, report)
+
+
+def test_targets_no_move_can_help_leave_the_rotation_unchanged():
+    employees = roster(3, 'G')
+    schedule, report = solve(employees, {'A': 2})
+    
+    assert report['status'] == 'unchanged'
+    assert report['shortfall'] == report['initial_shortfall'] == 2 * NUM_DAYS
+    assert report['changes'] == []
+
+
+@pytest.mark.parametrize('time_budget', [0.0001, 0.05])
+def test_time_budget_is_respected(time_budget):
+    # Targets no roster of this size can meet keep the search going
+    employees = roster(3000)
+    daily = [[1500 if (day + shift) % 3 else 0 for day in range(NUM_DAYS)] for shift in range(3)]
+    schedule, report = solve(employees, dict(zip('ABC', daily)), time_budget=time_budget)
+    
+    assert report['timed_out']
+    assert report['status'] in ('improved', 'unchanged')
+    assert report['shortfall'] > 0
+    # One search round may finish after the deadline
+    assert report['process_time'] < time_budget + 0.5
+    assert_rotation_kept(employees, schedule, report)